@@ -1,21 +1,45 @@
 import sys
 import json
+import argparse
+import collections
+import cProfile
+import functools
+import threading
+import socket
+import socketserver
+from concurrent.futures import ThreadPoolExecutor
 import serial
 import serial.tools.list_ports
 import base64
 import urllib.request
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, SimpleHTTPRequestHandler, ThreadingHTTPServer
 import tempfile
 import zipfile
 import os
 import shutil
+import time
+import zlib
+import bz2
+import hashlib
+import mmap
+import struct
+import itertools
+import bisect
+import contextlib
+import traceback
+import gc
+import random
+from array import array
 from packaging import version
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QLabel, QPushButton, QComboBox, QLineEdit,
     QTabWidget, QVBoxLayout, QHBoxLayout, QFormLayout, QTextEdit, QMessageBox,
-    QFileDialog, QGroupBox, QTableWidget, QHeaderView, QMenuBar, QMenu, QSizePolicy
+    QFileDialog, QGroupBox, QTableWidget, QHeaderView, QMenuBar, QMenu, QSizePolicy,
+    QDialog, QDialogButtonBox, QListWidget, QListWidgetItem
 )
-from PyQt5.QtCore import QTimer, Qt, QRegExp
-from PyQt5.QtGui import QColor, QIntValidator, QRegExpValidator
+from PyQt5.QtCore import QTimer, Qt, QRegExp, QObject, QEvent, pyqtSignal
+from PyQt5.QtGui import QColor, QIntValidator, QRegExpValidator, QKeySequence
 
 # Try to import cryptography for encryption
 try:
@@ -24,30 +48,174 @@ try:
 except ImportError:
     CRYPTO_AVAILABLE = False
 
+# Try to import pyusb for flashing devices in ST DFU mode
+try:
+    import usb.core
+    USB_AVAILABLE = True
+except ImportError:
+    USB_AVAILABLE = False
+
+# Pseudo-terminals for the device stand-ins (not available on Windows)
+try:
+    import tty
+    PTY_AVAILABLE = True
+except ImportError:
+    PTY_AVAILABLE = False
+
+# Peak memory for the benchmark suite (not available on Windows)
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    RESOURCE_AVAILABLE = False
+
 MB_COUNT = 128
 
+# STM32 USB IDs: CDC virtual COM port, DFU bootloader, ST-LINK
+STM32_USB_IDS = [(0x0483, 0x5740), (0x0483, 0xDF11), (0x0483, 0x3748)]
+STM32_DFU_ID = (0x0483, 0xDF11)
+STM32_CDC_ID = (0x0483, 0x5740)
+
+# Identity of devices seen before, keyed by USB serial number
+DEVICE_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".iot_configurator_devices.json")
+
 # Encryption key for config files (must be 32 bytes)
 ENCRYPTION_KEY = b'Dq0J8JhG2XeZ4Y7q1v3z0p0v3X3R5e8v2'  # 32 bytes
 
+def offtin(buf, pos):
+    # bsdiff's signed-magnitude 64-bit integer
+    value = int.from_bytes(buf[pos:pos + 8], "little")
+    return -(value & 0x7FFFFFFFFFFFFFFF) if value & (1 << 63) else value
+
+def add_bytes(a, b):
+    """Bytewise (a + b) mod 256 over whole blocks, using big-int arithmetic instead of a Python loop"""
+    n = len(a)
+    if not n:
+        return b""
+    x, y = int.from_bytes(a, "little"), int.from_bytes(b, "little")
+    low, high = int.from_bytes(b"\x7f" * n, "little"), int.from_bytes(b"\x80" * n, "little")
+    return (((x & low) + (y & low)) ^ ((x ^ y) & high)).to_bytes(n, "little")
+
+def bspatch(old, patch):
+    """Apply a BSDIFF40 patch (as produced by bsdiff / bsdiff4)"""
+    if patch[:8] != b"BSDIFF40":
+        raise ValueError("not a BSDIFF40 patch")
+    ctrl_len, diff_len, new_size = offtin(patch, 8), offtin(patch, 16), offtin(patch, 24)
+    ctrl = bz2.decompress(patch[32:32 + ctrl_len])
+    diff = bz2.decompress(patch[32 + ctrl_len:32 + ctrl_len + diff_len])
+    extra = bz2.decompress(patch[32 + ctrl_len + diff_len:])
+    new = bytearray()
+    old_pos = diff_pos = extra_pos = 0
+    for i in range(0, len(ctrl), 24):
+        add, copy, seek = offtin(ctrl, i), offtin(ctrl, i + 8), offtin(ctrl, i + 16)
+        if add < 0 or copy < 0 or len(new) + add + copy > new_size or old_pos < 0:
+            raise ValueError("corrupt patch")
+        source = old[old_pos:old_pos + add].ljust(add, b"\x00")
+        new += add_bytes(diff[diff_pos:diff_pos + add], source)
+        diff_pos += add
+        old_pos += add
+        new += extra[extra_pos:extra_pos + copy]
+        extra_pos += copy
+        old_pos += seek
+    if len(new) != new_size:
+        raise ValueError("corrupt patch")
+    return bytes(new)
+
 class UpdateChecker:
     GITHUB_REPO = "MohitPatel94/iot-configurator"  # Replace with your GitHub repo
     CURRENT_VERSION = "1.0.0"  # Update this with each release
+    # Overridable so updates can be exercised against a local release server
+    API_URL = os.environ.get("IOT_CONFIGURATOR_UPDATE_API", "https://api.github.com")
     
     @staticmethod
     def get_latest_release_info():
         try:
-            url = f"https://api.github.com/repos/{UpdateChecker.GITHUB_REPO}/releases/latest"
+            url = f"{UpdateChecker.API_URL}/repos/{UpdateChecker.GITHUB_REPO}/releases/latest"
             with urllib.request.urlopen(url) as response:
                 data = json.loads(response.read().decode())
+                assets = {a['name']: a['browser_download_url'] for a in data['assets']}
+                zips = [url for name, url in assets.items() if name.endswith(".zip")]
                 return {
                     'version': data['tag_name'],
                     'url': data['html_url'],
-                    'download_url': data['assets'][0]['browser_download_url'] if data['assets'] else None,
-                    'body': data['body']
+                    'download_url': zips[0] if zips else (data['assets'][0]['browser_download_url'] if data['assets'] else None),
+                    'body': data['body'],
+                    'assets': assets
                 }
         except Exception as e:
             print(f"Error checking for updates: {e}")
             return None
+
+    @staticmethod
+    def published_sha256(latest, filename):
+        """Expected SHA-256 of the new application file, from the release's SHA256SUMS asset"""
+        url = latest['assets'].get("SHA256SUMS")
+        if not url:
+            return None
+        with urllib.request.urlopen(url) as response:
+            sums = {}
+            for line in response.read().decode().splitlines():
+                digest, _, name = line.strip().partition(" ")
+                if name:
+                    sums[name.strip().lstrip("*")] = digest.lower()
+        if filename in sums:
+            return sums[filename]
+        apps = [d for name, d in sums.items() if name.endswith(".py") or name.endswith(".exe")]
+        return apps[0] if len(apps) == 1 else None
+
+    @staticmethod
+    def download_full(latest, temp_dir, extracting=None):
+        """Download and extract the release zip; returns the application file, checked against SHA256SUMS"""
+        zip_path = os.path.join(temp_dir, "update.zip")
+        urllib.request.urlretrieve(latest['download_url'], zip_path)
+        
+        # Extract the update
+        if extracting:
+            extracting()
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            zip_ref.extractall(temp_dir)
+        
+        # Find the executable/script in the extracted files
+        new_version_file = None
+        for file in os.listdir(temp_dir):
+            if file.endswith(".py") or file.endswith(".exe"):
+                new_version_file = os.path.join(temp_dir, file)
+                break
+        
+        if not new_version_file:
+            raise Exception("Could not find application file in the update package")
+        
+        expected = UpdateChecker.published_sha256(latest, os.path.basename(new_version_file))
+        if expected:
+            with open(new_version_file, "rb") as f:
+                if hashlib.sha256(f.read()).hexdigest() != expected:
+                    raise Exception("Downloaded update does not match its published SHA-256")
+        return new_version_file
+
+    @staticmethod
+    def apply_delta(latest, current_path, temp_dir):
+        """Patch the installed file to the latest version if a delta for this version is published.
+        Returns the path of the verified new file, or None to fall back to the full download."""
+        patch_url = latest['assets'].get(f"{UpdateChecker.CURRENT_VERSION}-to-{latest['version']}.bsdiff")
+        if not patch_url:
+            return None
+        try:
+            expected = UpdateChecker.published_sha256(latest, os.path.basename(current_path))
+            if not expected:
+                return None
+            with urllib.request.urlopen(patch_url) as response:
+                patch = response.read()
+            with open(current_path, "rb") as f:
+                new = bspatch(f.read(), patch)
+            if hashlib.sha256(new).hexdigest() != expected:
+                return None
+            new_path = os.path.join(temp_dir, os.path.basename(current_path))
+            with open(new_path, "wb") as f:
+                f.write(new)
+            return new_path
+        except Exception as e:
+            print(f"Delta update failed, using full download: {e}")
+            return None
     
     @staticmethod
     def is_update_available():
@@ -79,33 +247,21 @@ class UpdateChecker:
             
             # Create temporary directory
             temp_dir = tempfile.mkdtemp()
-            zip_path = os.path.join(temp_dir, "update.zip")
             
-            # Download the update
-            parent_widget.status_label.setText("Downloading update...")
-            QApplication.processEvents()  # Force UI update
-            urllib.request.urlretrieve(latest['download_url'], zip_path)
+            # Determine current application path
+            current_path = os.path.abspath(sys.argv[0])
+            backup_path = current_path + ".bak"
             
-            # Extract the update
-            parent_widget.status_label.setText("Extracting update...")
+            # Prefer a small binary delta from the installed version
+            parent_widget.status_label.setText("Downloading update...")
             QApplication.processEvents()  # Force UI update
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
-            
-            # Find the executable/script in the extracted files
-            extracted_files = os.listdir(temp_dir)
-            new_version_file = None
-            for file in extracted_files:
-                if file.endswith(".py") or file.endswith(".exe"):
-                    new_version_file = os.path.join(temp_dir, file)
-                    break
+            new_version_file = UpdateChecker.apply_delta(latest, current_path, temp_dir)
             
             if not new_version_file:
-                raise Exception("Could not find application file in the update package")
-            
-            # Determine current application path
-            current_path = os.path.abspath(sys.argv[0])
-            backup_path = current_path + ".bak"
+                def extracting():
+                    parent_widget.status_label.setText("Extracting update...")
+                    QApplication.processEvents()  # Force UI update
+                new_version_file = UpdateChecker.download_full(latest, temp_dir, extracting)
             
             # Create backup
             shutil.copy2(current_path, backup_path)
@@ -317,25 +473,2001 @@ BLUE_THEME = """
     }
 """
 
-class NameValidator(QRegExpValidator):
-    def __init__(self, max_bytes, parent=None):
-        super().__init__(QRegExp(".*"), parent)
-        self.max_bytes = max_bytes
+class FieldSpec:
+    """One DEVICE CONFIGURATION field: how it is edited, validated and converted to/from the wire"""
+    def __init__(self, key, label, group, kind="text", max_length=32, limits=None,
+                 choices=None, fallback=None, wire=str):
+        self.key = key
+        self.label = label
+        self.group = group
+        self.kind = kind            # "text", "int" or "choice"
+        self.max_length = max_length
+        self.limits = limits        # (min, max) for "int"
+        self.choices = choices      # [(display text, wire value)] for "choice"
+        self.fallback = fallback    # index shown for unknown wire values (None leaves the combo alone)
+        self.wire = wire            # wire type for "int" fields
+
+    def create_widget(self, on_change):
+        if self.kind == "choice":
+            widget = QComboBox()
+            widget.addItems([text for text, _ in self.choices])
+            widget.currentIndexChanged.connect(on_change)
+            return widget
+        widget = QLineEdit()
+        if self.kind == "int":
+            widget.setValidator(QIntValidator(*self.limits))
+        else:
+            widget.setMaxLength(self.max_length)
+        widget.textChanged.connect(on_change)
+        return widget
+
+    # The converters below are built once per widget so serialization needs no per-field dispatch
+
+    def to_wire(self, widget):
+        if self.kind == "choice":
+            values = [value for _, value in self.choices]
+            return lambda: values[widget.currentIndex()]
+        if self.kind == "int" and self.wire is int:
+            def read():
+                try:
+                    return int(widget.text())
+                except ValueError:
+                    raise ValueError(f"Invalid {self.key} value")
+            return read
+        return widget.text
+
+    def from_wire(self, widget):
+        if self.kind == "choice":
+            index = {value: i for i, (_, value) in enumerate(self.choices)}
+            fallback = self.fallback
+            def write(val):
+                try:
+                    idx = index.get(int(val), fallback)
+                except (TypeError, ValueError):
+                    idx = fallback
+                if idx is not None:
+                    widget.setCurrentIndex(idx)
+            return write
+        return lambda val: widget.setText(str(val))
+
+    def has_data(self, widget):
+        if self.kind == "choice":
+            return lambda: widget.currentIndex() > 0
+        return lambda: bool(widget.text().strip())
+
+    def clearer(self, widget):
+        if self.kind == "choice":
+            return lambda: widget.setCurrentIndex(0)
+        return widget.clear
+
+    def validate(self, value):
+        """Wire value for a value from outside the GUI, which must fit what the widget would accept"""
+        if self.kind == "choice":
+            values = [v for _, v in self.choices]
+            if isinstance(value, bool) or value not in values:
+                raise ValueError(f"{self.key} must be one of {values}")
+            return value
+        if self.kind == "int":
+            low, high = self.limits
+            try:
+                if isinstance(value, (bool, float)):
+                    raise ValueError
+                number = int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{self.key} must be an integer")
+            if not low <= number <= high:
+                raise ValueError(f"{self.key} must be between {low} and {high}")
+            return self.wire(number)
+        if not isinstance(value, str):
+            raise ValueError(f"{self.key} must be a string")
+        if len(value) > self.max_length:
+            raise ValueError(f"{self.key} is longer than {self.max_length} characters")
+        return value
+
+CONFIG_GROUPS = ["DEVICE", "MODBUS", "MQTT"]
+
+CONFIG_SCHEMA = [
+    FieldSpec("SSID", "WiFi Name:", "DEVICE"),
+    FieldSpec("PASS", "WiFi Password:", "DEVICE"),
+    FieldSpec("SiteName", "Site Name:", "DEVICE", max_length=16),
+    FieldSpec("PanelName", "Panel Name:", "DEVICE", max_length=16),
+    FieldSpec("Interval", "Transmit Time (s):", "DEVICE", kind="int", limits=(1, 86400), wire=int),
+    FieldSpec("BaudRate", "Baud Rate:", "MODBUS", kind="choice",
+              choices=[(str(b), b) for b in (9600, 19200, 38400, 57600, 115200)]),
+    FieldSpec("StopBit", "Stop Bit:", "MODBUS", kind="choice", choices=[("1", 0), ("2", 8192)], fallback=1),
+    FieldSpec("Parity", "Parity:", "MODBUS", kind="choice",
+              choices=[("None", 0), ("Odd", 1536), ("Even", 1024)], fallback=0),
+    FieldSpec("IP", "IP Address:", "MQTT"),
+    FieldSpec("Port", "Port:", "MQTT", kind="int", limits=(0, 65535)),
+    FieldSpec("mqttUser", "Username:", "MQTT"),
+    FieldSpec("mqttPass", "Password:", "MQTT"),
+    FieldSpec("PubTopic", "Publish Topic:", "MQTT"),
+    FieldSpec("SubTopic", "Subscribe Topic:", "MQTT"),
+]
+
+REGISTER_KEYS = ["Name", "Address", "Function", "SlaveID", "Bytes"]
+FUNCTION_NAMES = ["Coils", "Discrete Inputs", "Holding Registers", "Input Registers"]
+
+class RegisterMap:
+    """Modbus register map held column-wise in typed arrays, with the names packed into one
+    UTF-8 buffer. Shared by the table, the device protocol and .mb files."""
+    NAME_BYTES = 11
+    WIRE_HEADER = struct.Struct("<H")     # register count
+    WIRE_RECORD = struct.Struct("<BHBBB") # slave ID, address, function, bytes, name length; name follows
+    __slots__ = ("slave_ids", "addresses", "functions", "widths", "names", "name_ends")
+
+    def __init__(self):
+        self.slave_ids = array("B")
+        self.addresses = array("H")
+        self.functions = array("B")
+        self.widths = array("B")
+        self.names = bytearray()
+        self.name_ends = array("H")
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def append(self, slave_id, name, address, function, width):
+        if not 0 <= slave_id <= 247:
+            raise ValueError("Slave ID must be between 0 and 247")
+        if not 0 <= address <= 65535:
+            raise ValueError("Address must be between 0 and 65535")
+        if not 1 <= function <= 4:
+            raise ValueError("Function must be between 1 and 4")
+        if not 1 <= width <= 4:
+            raise ValueError("Bytes must be between 1 and 4")
+        self.slave_ids.append(slave_id)
+        self.addresses.append(address)
+        self.functions.append(function)
+        self.widths.append(width)
+        self.names += self.encode_name(name)
+        self.name_ends.append(len(self.names))
+
+    @classmethod
+    def encode_name(cls, name):
+        return name.encode()[:cls.NAME_BYTES].decode(errors="ignore").encode()
+
+    def name(self, i):
+        start = self.name_ends[i - 1] if i else 0
+        return self.names[start:self.name_ends[i]].decode()
+
+    def name_list(self):
+        starts = [0] + list(self.name_ends[:-1])
+        names = bytes(self.names)
+        return [names[a:b].decode() for a, b in zip(starts, self.name_ends)]
+
+    @classmethod
+    def from_json(cls, data):
+        """Bulk-build from the device/file layout: parallel lists keyed Name, Address, Function, SlaveID, Bytes.
+        Applies the same limits as append(). Bytes may be absent (older firmware and files) and then defaults to 1."""
+        if not isinstance(data, dict):
+            raise ValueError("Register map must be a JSON object")
+        for key in REGISTER_KEYS:
+            if key != "Bytes" and not isinstance(data.get(key), list):
+                raise ValueError(f"Missing register column: {key}")
+        if "Bytes" in data and not isinstance(data["Bytes"], list):
+            raise ValueError("Missing register column: Bytes")
+        regs = cls()
+        count = min(len(data["Name"]), MB_COUNT)
+        widths = data["Bytes"][:count] if "Bytes" in data else [1] * count
+        try:
+            regs.slave_ids = array("B", map(int, data["SlaveID"][:count]))
+            regs.addresses = array("H", map(int, data["Address"][:count]))
+            regs.functions = array("B", map(int, data["Function"][:count]))
+            regs.widths = array("B", map(int, widths))
+        except OverflowError:
+            raise ValueError("Register value out of range")
+        except TypeError as e:
+            raise ValueError(str(e))
+        if not len(regs.slave_ids) == len(regs.addresses) == len(regs.functions) == len(regs.widths) == count:
+            raise ValueError("Register lists have different lengths")
+        if count:
+            if max(regs.slave_ids) > 247:
+                raise ValueError("Slave ID must be between 0 and 247")
+            if min(regs.functions) < 1 or max(regs.functions) > 4:
+                raise ValueError("Function must be between 1 and 4")
+            if min(regs.widths) < 1 or max(regs.widths) > 4:
+                raise ValueError("Bytes must be between 1 and 4")
+        encoded = [cls.encode_name(str(n)) for n in data["Name"][:count]]
+        regs.names = bytearray(b"".join(encoded))
+        regs.name_ends = array("H", itertools.accumulate(len(n) for n in encoded))
+        return regs
+
+    def to_json(self):
+        return {
+            "Name": self.name_list(),
+            "Address": self.addresses.tolist(),
+            "Function": self.functions.tolist(),
+            "SlaveID": self.slave_ids.tolist(),
+            "Bytes": self.widths.tolist(),
+        }
+
+    def to_bytes(self):
+        """Compact binary form: count, then per register the fixed fields and the name bytes"""
+        out = bytearray(self.WIRE_HEADER.pack(len(self)))
+        start = 0
+        for i, end in enumerate(self.name_ends):
+            out += self.WIRE_RECORD.pack(self.slave_ids[i], self.addresses[i], self.functions[i],
+                                         self.widths[i], end - start)
+            out += self.names[start:end]
+            start = end
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, buf):
+        regs = cls()
+        (count,) = cls.WIRE_HEADER.unpack_from(buf)
+        pos = cls.WIRE_HEADER.size
+        for _ in range(count):
+            slave_id, address, function, width, length = cls.WIRE_RECORD.unpack_from(buf, pos)
+            pos += cls.WIRE_RECORD.size
+            if pos + length > len(buf):
+                raise ValueError("Truncated register map")
+            regs.append(slave_id, bytes(buf[pos:pos + length]).decode(errors="ignore"), address, function, width)
+            pos += length
+        return regs
+
+def canonical_config(data):
+    """Device config with wire types, whichever source it came from (device reply, file, GUI)"""
+    config = {}
+    for spec in CONFIG_SCHEMA:
+        val = data.get(spec.key)
+        try:
+            config[spec.key] = int(val) if spec.kind == "choice" or spec.wire is int else str(val if val is not None else "")
+        except (TypeError, ValueError):
+            config[spec.key] = val
+    return config
+
+def validate_config(data):
+    """Complete device config in wire types from an outside source (daemon PUT), or ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError("config must be a JSON object")
+    missing = [spec.key for spec in CONFIG_SCHEMA if spec.key not in data]
+    if missing:
+        raise ValueError("missing fields: " + ", ".join(missing))
+    return {spec.key: spec.validate(data[spec.key]) for spec in CONFIG_SCHEMA}
+
+def validate_registers(data):
+    """Complete register map from an outside source (daemon PUT), or ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError("register map must be a JSON object")
+    missing = [key for key in REGISTER_KEYS if key not in data]
+    if missing:
+        raise ValueError("missing columns: " + ", ".join(missing))
+    if isinstance(data["Name"], list) and len(data["Name"]) > MB_COUNT:
+        raise ValueError(f"at most {MB_COUNT} registers")
+    return RegisterMap.from_json(data).to_json()
+
+class RegisterIndex:
+    """Lookup structures over the MODBUS table rows, updated one row at a time as cells change.
+    Queries are whitespace-separated terms that must all match:
+      text       JSON Name contains text        ^text        JSON Name starts with text
+      slave:N    Slave ID is N                  fc:N / fc:hold   function code or name prefix
+      addr:A     Read Address is A              addr:A-B     Read Address in A..B"""
+    def __init__(self):
+        self.rows = {}       # row -> (name, slave, address, function, width); name lower-cased
+        self.names = []      # sorted (name, row), for prefix queries
+        self.by_slave = {}   # slave -> sorted [(address, row)]
+        self.used_by_slave = {}      # slave -> rows with a name or an address
+        self.named_by_function = {}  # function code -> rows with a name
+
+    def update(self, row, name, slave, address, function, width):
+        entry = (name.lower(), slave, address, function, width)
+        old = self.rows.get(row)
+        if old == entry:
+            return
+        if old:
+            if old[0]:
+                del self.names[bisect.bisect_left(self.names, (old[0], row))]
+                self.named_by_function[old[3]].discard(row)
+            if old[2] is not None:
+                addresses = self.by_slave[old[1]]
+                del addresses[bisect.bisect_left(addresses, (old[2], row))]
+            if old[0] or old[2] is not None:
+                self.used_by_slave[old[1]].discard(row)
+        self.rows[row] = entry
+        if entry[0]:
+            bisect.insort(self.names, (entry[0], row))
+            self.named_by_function.setdefault(function, set()).add(row)
+        if address is not None:
+            bisect.insort(self.by_slave.setdefault(slave, []), (address, row))
+        if entry[0] or address is not None:
+            self.used_by_slave.setdefault(slave, set()).add(row)
+
+    def address_range(self, low, high, slave=None):
+        slaves = [slave] if slave is not None else list(self.by_slave)
+        rows = set()
+        for s in slaves:
+            addresses = self.by_slave.get(s, [])
+            start = bisect.bisect_left(addresses, (low, -1))
+            end = bisect.bisect_right(addresses, (high, MB_COUNT))
+            rows.update(row for _, row in addresses[start:end])
+        return rows
+
+    def query(self, text):
+        """Rows matching every term, or None when the query is empty"""
+        terms = text.split()
+        if not terms:
+            return None
+        slave = next((int(t[6:]) for t in terms if t.startswith("slave:") and t[6:].isdigit()), None)
+        result = None
+        for term in terms:
+            key, _, value = term.partition(":")
+            if key == "slave" and value.isdigit():
+                rows = set(self.used_by_slave.get(slave, ()))
+            elif key == "addr" and value:
+                low, _, high = value.partition("-")
+                try:
+                    rows = self.address_range(int(low), int(high or low), slave)
+                except ValueError:
+                    rows = set()
+            elif key == "fc" and value:
+                if value.isdigit():
+                    wanted = {int(value)}
+                else:
+                    wanted = {i + 1 for i, n in enumerate(FUNCTION_NAMES) if n.lower().startswith(value.lower())}
+                rows = set().union(*(self.named_by_function.get(fc, ()) for fc in wanted))
+            elif term.startswith("^"):
+                prefix = term[1:].lower()
+                start = bisect.bisect_left(self.names, (prefix, -1))
+                rows = set()
+                for name, row in self.names[start:]:
+                    if not name.startswith(prefix):
+                        break
+                    rows.add(row)
+            else:
+                needle = term.lower()
+                rows = {row for name, row in self.names if needle in name}
+            result = rows if result is None else result & rows
+        return result
+
+    def sort_key(self, column):
+        # Table column -> position in the row entry; empty rows sort last
+        field = [1, 0, 2, 3, 4][column]
+        return lambda row: (not self.rows[row][0], self.rows[row][field] if self.rows[row][field] is not None else -1)
+
+def canonical_registers(data):
+    return RegisterMap.from_json(data).to_json()
+
+def audit_sections(config, registers):
+    """Split a device's state into sections and fingerprint each one, so equal sections compare by digest"""
+    sections = {}
+    if config is not None:
+        config = canonical_config(config)
+        for group in CONFIG_GROUPS:
+            sections[group.lower()] = {s.key: config[s.key] for s in CONFIG_SCHEMA if s.group == group}
+    if registers is not None:
+        sections["registers"] = canonical_registers(registers)
+    return {name: (hashlib.sha256(canonical_json(data).encode()).hexdigest(), data)
+            for name, data in sections.items()}
+
+def audit_report(results, reference=None, reference_name=None):
+    """Text report of a fleet audit. Without a reference each section is compared with the majority."""
+    if reference is None:
+        reference = {}
+        for name in ["device", "modbus", "mqtt", "registers"]:
+            counts = collections.Counter(r["sections"][name][0] for r in results if name in r.get("sections", {}))
+            if counts:
+                digest = counts.most_common(1)[0][0]
+                reference[name] = next(r["sections"][name] for r in results
+                                       if r.get("sections", {}).get(name, (None,))[0] == digest)
+        reference_name = "majority of devices"
+    lines = [f"Fleet audit: {len(results)} device(s), reference: {reference_name}", ""]
+    mismatched = 0
+    for r in results:
+        header = f"{r['port']}  {r.get('label', '')}".rstrip()
+        if r.get("error"):
+            lines.append(f"{header}  ERROR: {r['error']}")
+            mismatched += 1
+            continue
+        states, details = [], []
+        for name, (digest, data) in r["sections"].items():
+            if name not in reference:
+                continue
+            ref_digest, ref_data = reference[name]
+            if digest == ref_digest:
+                states.append(f"{name} OK")
+            else:
+                states.append(f"{name} DIFF")
+                details += [f"    {d}" for d in config_differences(ref_data, data)]
+        mismatched += bool(details)
+        lines.append(f"{header}  " + "  ".join(states))
+        lines += details
+    lines += ["", f"{len(results) - mismatched} of {len(results)} device(s) match."]
+    return "\n".join(lines)
+
+class FleetAuditor(QObject):
+    """Reads config and register map from every attached device concurrently"""
+    finished = pyqtSignal(object)
+    MAX_WORKERS = 16
+
+    def start(self, ports, ready=None):
+        """ready, if given, is called on the worker thread before any port is opened"""
+        threading.Thread(target=self.run, args=(ports, ready), daemon=True).start()
+
+    def run(self, ports, ready=None):
+        if ready:
+            ready()
+        with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
+            results = list(executor.map(self.audit_port, ports))
+        self.finished.emit(results)
+
+    def audit_port(self, port):
+        device, label = port
+        try:
+            config, registers = query_port(device, [{"DataType": 1}, {"DataType": 3}], timeout=3.0)
+        except Exception as e:
+            return {"port": device, "label": label, "error": str(e)}
+        if config is None and registers is None:
+            return {"port": device, "label": label, "error": "no reply"}
+        try:
+            return {"port": device, "label": label, "sections": audit_sections(config, registers)}
+        except (ValueError, KeyError) as e:
+            return {"port": device, "label": label, "error": f"invalid reply: {e}"}
+
+class NameValidator(QRegExpValidator):
+    def __init__(self, max_bytes, parent=None):
+        super().__init__(QRegExp(".*"), parent)
+        self.max_bytes = max_bytes
+
+    def validate(self, text, pos):
+        state, text, pos = super().validate(text, pos)
+        if len(text.encode('utf-8')) > self.max_bytes:
+            return (QRegExpValidator.Invalid, text, pos)
+        return (state, text, pos)
+
+def encode_config_file(fname, data):
+    json_data = json.dumps(data).encode()
+    
+    if CRYPTO_AVAILABLE:
+        try:
+            fernet = Fernet(ENCRYPTION_KEY)
+            encrypted = fernet.encrypt(json_data)
+            encoded = base64.b64encode(encrypted).decode()
+        except:
+            encoded = base64.b64encode(json_data).decode()
+    else:
+        encoded = base64.b64encode(json_data).decode()
+        
+    with open(fname, "w") as f:
+        f.write(encoded)
+
+def decode_config_file(fname):
+    """Read a .cfg/.mb file: base64 (optionally Fernet-encrypted) JSON, or plain JSON"""
+    with open(fname, "r") as f:
+        encoded = f.read().strip()
+        
+    try:
+        decoded = base64.b64decode(encoded)
+    except:
+        with open(fname, "r") as f:
+            return json.load(f)
+        
+    if CRYPTO_AVAILABLE:
+        try:
+            fernet = Fernet(ENCRYPTION_KEY)
+            decrypted = fernet.decrypt(decoded)
+            return json.loads(decrypted.decode())
+        except:
+            return json.loads(decoded.decode())
+    return json.loads(decoded.decode())
+
+def canonical_json(section_data):
+    return json.dumps(section_data, sort_keys=True, separators=(",", ":"))
+
+def config_checksum(section_data):
+    """CRC32 over the canonical JSON form of a config section (sorted keys, no whitespace)"""
+    return zlib.crc32(canonical_json(section_data).encode()) & 0xFFFFFFFF
+
+def normalize_device_reply(template, reply):
+    """Coerce a device reply into the same shape and types as a config section we sent"""
+    normalized = {}
+    count = len(reply.get("Name", [])) if "Name" in template else None
+    for key, want in template.items():
+        got = reply.get(key)
+        try:
+            if isinstance(want, list):
+                kind = type(want[0]) if want else str
+                got = [kind(v) for v in (got or [])[:count]]
+                if key == "Name":
+                    got = [v[:11] for v in got]
+            elif got is not None:
+                got = type(want)(got)
+        except (TypeError, ValueError):
+            pass
+        normalized[key] = got
+    return normalized
+
+def config_differences(expected, actual):
+    diffs = []
+    for key, want in expected.items():
+        got = actual.get(key)
+        if isinstance(want, list):
+            got = got or []
+            for i in range(max(len(want), len(got))):
+                w = want[i] if i < len(want) else None
+                g = got[i] if i < len(got) else None
+                if w != g:
+                    diffs.append(f"{key}[{i+1}]: expected {w!r}, device has {g!r}")
+        elif want != got:
+            diffs.append(f"{key}: expected {want!r}, device has {got!r}")
+    return diffs
+
+def is_stm32_port(p):
+    # Check using multiple criteria to identify STM32 CDC ports
+    return (
+        # Check VID/PID pairs
+        (getattr(p, 'vid', None) is not None and (p.vid, p.pid) in STM32_USB_IDS) or
+        # Check description
+        (p.description and 
+         ("STM32" in p.description.upper() and "CDC" in p.description.upper())) or
+        # Check manufacturer
+        (getattr(p, 'manufacturer', None) and "STMicroelectronics" in p.manufacturer)
+    )
+
+def is_dfu_port(p):
+    return getattr(p, 'vid', None) is not None and (p.vid, p.pid) == STM32_DFU_ID
+
+def is_flash_target(p, identity):
+    """Whether the CDC uploader may be pointed at a port: our firmware's CDC interface, or a port
+    whose device answered the identify probe. Anything else (an ST-LINK VCP) is left alone."""
+    if is_dfu_port(p):
+        return False
+    if getattr(p, 'vid', None) is not None and (p.vid, p.pid) == STM32_CDC_ID:
+        return True
+    return bool(identity) and "Version" in identity
+
+def port_key(p):
+    """Stable identity of a USB port: serial number if the device has one, else its USB location"""
+    return getattr(p, 'serial_number', None) or getattr(p, 'location', None) or p.device
+
+COMMAND_CHUNK = 64  # commands are written in chunks the device's USB receive buffer can take
+
+def write_command(ser, cmd):
+    line = (json.dumps(cmd) + "\n").encode()
+    for pos in range(0, len(line), COMMAND_CHUNK):
+        ser.write(line[pos:pos + COMMAND_CHUNK])
+
+def exchange(ser, commands, timeout=1.0, first_seq=1):
+    """Send command lines on an open port and collect one JSON reply per command (None on timeout).
+    Commands are numbered from first_seq; callers that keep the port open pass a running counter
+    so that a late reply to an earlier exchange cannot answer this one."""
+    replies = [None] * len(commands)
+    waiting = {}
+    for i, cmd in enumerate(commands):
+        cmd = dict(cmd, Seq=(first_seq - 1 + i) % 65535 + 1)
+        waiting[cmd["Seq"]] = (i, cmd["DataType"])
+        write_command(ser, cmd)
+    deadline = time.monotonic() + timeout
+    while waiting and time.monotonic() < deadline:
+        line = ser.readline().decode(errors='ignore').strip()
+        if not (line.startswith("{") and line.endswith("}")):
+            continue
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        seq = data.get("Seq")
+        kind = RequestTracker.request_kind(data)
+        if "Seq" in data:
+            if seq not in waiting or waiting[seq][1] != kind:
+                continue  # stale reply to an earlier exchange, or not an answer to this request
+        else:
+            # Firmware without Seq support: match the oldest request of the same kind
+            seq = next((s for s, (_, k) in waiting.items() if k == kind), None)
+            if seq is None:
+                continue
+        replies[waiting.pop(seq)[0]] = data
+    return replies
+
+def query_port(device, commands, timeout=1.0):
+    with serial.Serial(device, 115200, timeout=0.1) as ser:
+        return exchange(ser, commands, timeout)
+
+class DeviceProber(QObject):
+    """Identifies attached devices in the background and remembers them by USB serial number"""
+    identified = pyqtSignal(str, object)
+    MAX_WORKERS = 8
+    # Ports that did not answer are left alone for a while, backing off up to RETRY_MAX seconds
+    RETRY_DELAY = 10.0
+    RETRY_MAX = 600.0
+    PROBE_TIME = 3.0  # longest a probe holds a port open: both queries time out, plus the opens
+
+    def __init__(self, cache_path=DEVICE_CACHE_PATH):
+        super().__init__()
+        self.cache_path = cache_path
+        self.cache = {}
+        self.in_progress = set()
+        self.unanswered = {}  # key -> (monotonic time of the next attempt, current delay)
+        self.busy = set()  # device paths with a probe queued or running
+        self.idle = threading.Condition()
+        self.paused = False
+        self.executor = ThreadPoolExecutor(max_workers=self.MAX_WORKERS)
+        try:
+            with open(cache_path, "r") as f:
+                self.cache = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def probe(self, port_info):
+        key = port_key(port_info)
+        if key in self.cache or key in self.in_progress:
+            return
+        if self.paused or time.monotonic() < self.unanswered.get(key, (0, 0))[0]:
+            return
+        self.in_progress.add(key)
+        with self.idle:
+            self.busy.add(port_info.device)
+        self.executor.submit(self._probe, key, port_info)
+
+    def _probe(self, key, port_info):
+        try:
+            if self.paused:
+                self.in_progress.discard(key)
+            else:
+                self._identify(key, port_info)
+        finally:
+            with self.idle:
+                self.busy.discard(port_info.device)
+                self.idle.notify_all()
+
+    def _identify(self, key, port_info):
+        identity = {}
+        if is_dfu_port(port_info):
+            identity["DFU"] = True
+        else:
+            try:
+                # Identify request (DataType 7); older firmware only answers the full config read
+                reply = query_port(port_info.device, [{"DataType": 7}], timeout=0.5)[0]
+                if reply is None:
+                    reply = query_port(port_info.device, [{"DataType": 1}], timeout=1.0)[0]
+            except Exception:
+                reply = None
+            if reply is None:
+                # Busy or not our firmware; try again later, less and less often
+                delay = min(self.unanswered.get(key, (0, self.RETRY_DELAY / 2))[1] * 2, self.RETRY_MAX)
+                self.unanswered[key] = (time.monotonic() + delay, delay)
+                self.in_progress.discard(key)
+                return
+            identity = {k: reply[k] for k in ("Version", "SiteName", "PanelName") if k in reply}
+        self.identified.emit(key, identity)
+
+    def pause(self):
+        """Start no new probes (probes already queued give up) until resume()"""
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+
+    def wait_idle(self, devices, timeout=PROBE_TIME):
+        """Block until no probe is queued or running on any of the device paths; False on timeout"""
+        devices = set(devices)
+        with self.idle:
+            return self.idle.wait_for(lambda: not self.busy & devices, timeout)
+
+    def remember(self, key, identity):
+        self.in_progress.discard(key)
+        self.unanswered.pop(key, None)
+        self.cache[key] = dict(self.cache.get(key, {}), **identity)
+        self.save()
+
+    def forget(self, key):
+        """Drop what is known about a device (e.g. after new firmware) so it is probed again"""
+        self.unanswered.pop(key, None)
+        if self.cache.pop(key, None) is not None:
+            self.save()
+
+    def save(self):
+        try:
+            with open(self.cache_path, "w") as f:
+                json.dump(self.cache, f, indent=1)
+        except OSError:
+            pass
+
+    def label(self, port_info):
+        identity = self.cache.get(port_key(port_info))
+        if not identity:
+            return port_info.device
+        if identity.get("DFU"):
+            return f"{port_info.device} [DFU]"
+        name = "/".join(n for n in (identity.get("SiteName"), identity.get("PanelName")) if n)
+        if identity.get("Version"):
+            name += f" v{identity['Version']}"
+        return f"{port_info.device} {name}".strip()
+
+class TrafficRecorder:
+    """Appends serial traffic to a compact binary log: a magic header, then per chunk
+    a (monotonic ns, direction, length) record header followed by the raw bytes"""
+    MAGIC = b"IOTRAW1\n"
+    RECORD = struct.Struct("<QBI")
+    INBOUND, OUTBOUND = 0, 1
+
+    def __init__(self, path):
+        self.path = path
+        # An index left by an earlier recording at this path would describe the wrong file
+        try:
+            os.remove(path + ".idx")
+        except FileNotFoundError:
+            pass
+        self.file = open(path, "wb")
+        self.file.write(self.MAGIC)
+        self.offsets = array("Q")
+        self.lock = threading.Lock()
+
+    def record(self, direction, data):
+        if not data:
+            return
+        with self.lock:
+            self.offsets.append(self.file.tell())
+            self.file.write(self.RECORD.pack(time.monotonic_ns(), direction, len(data)))
+            self.file.write(data)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+            # Sidecar offset index so large captures open without a scan
+            with open(self.path + ".idx", "wb") as f:
+                self.offsets.tofile(f)
+
+class TrafficLog:
+    """Read-only, memory-mapped view of a TrafficRecorder file"""
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(TrafficRecorder.MAGIC)] != TrafficRecorder.MAGIC:
+            raise ValueError(f"{path} is not a traffic recording")
+        self.offsets = array("Q")
+        try:
+            with open(path + ".idx", "rb") as f:
+                self.offsets.frombytes(f.read())
+        except OSError:
+            pass
+        if not self.index_fits():
+            self.offsets = self.scan()
+
+    def index_fits(self):
+        # The index of a cleanly closed recording ends exactly where its last record does
+        header = TrafficRecorder.RECORD
+        if not self.offsets or self.offsets[-1] + header.size > len(self.map):
+            return False
+        last = self.offsets[-1]
+        return last + header.size + header.unpack_from(self.map, last)[2] == len(self.map)
+
+    def scan(self):
+        # No usable index (e.g. the recorder was killed): walk the record headers
+        offsets = array("Q")
+        header = TrafficRecorder.RECORD
+        pos, end = len(TrafficRecorder.MAGIC), len(self.map)
+        while pos + header.size <= end:
+            length = header.unpack_from(self.map, pos)[2]
+            if pos + header.size + length > end:
+                break
+            offsets.append(pos)
+            pos += header.size + length
+        return offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        """(monotonic ns, direction, payload memoryview) of record i"""
+        pos = self.offsets[i]
+        stamp, direction, length = TrafficRecorder.RECORD.unpack_from(self.map, pos)
+        start = pos + TrafficRecorder.RECORD.size
+        return stamp, direction, memoryview(self.map)[start:start + length]
+
+class RecordingSerial:
+    """Wraps an open serial port and records everything written to and read from it"""
+    def __init__(self, ser, recorder):
+        self.ser = ser
+        self.recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self.ser, name)
+
+    def write(self, data):
+        self.recorder.record(TrafficRecorder.OUTBOUND, data)
+        return self.ser.write(data)
+
+    def read(self, size=1):
+        data = self.ser.read(size)
+        self.recorder.record(TrafficRecorder.INBOUND, data)
+        return data
+
+    def readline(self):
+        data = self.ser.readline()
+        self.recorder.record(TrafficRecorder.INBOUND, data)
+        return data
+
+class ReplaySerial:
+    """Stands in for a serial port and plays back the inbound side of a recording.
+    speed scales the original timing (2.0 = twice as fast); 0 delivers as fast as it is read."""
+    MAX_PENDING = 64 * 1024  # bytes made available at a time, so a reader's poll stays short
+
+    def __init__(self, log, speed=1.0, direction=TrafficRecorder.INBOUND):
+        self.log = log
+        self.speed = speed
+        self.direction = direction
+        self.next = 0
+        self.buffer = bytearray()
+        self.origin = log[0][0] if len(log) else 0
+        self.started = time.monotonic_ns()
+        self.is_open = True
+        self.port = "replay"
+
+    def due(self):
+        elapsed = (time.monotonic_ns() - self.started) * (self.speed or float("inf"))
+        while self.next < len(self.log) and len(self.buffer) < self.MAX_PENDING:
+            stamp, direction, payload = self.log[self.next]
+            if stamp - self.origin > elapsed:
+                break
+            if direction == self.direction:
+                self.buffer += payload
+            self.next += 1
+
+    @property
+    def in_waiting(self):
+        self.due()
+        return len(self.buffer)
+
+    @property
+    def finished(self):
+        return self.next >= len(self.log) and not self.buffer
+
+    def read(self, size=1):
+        self.due()
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def readline(self):
+        self.due()
+        end = self.buffer.find(b"\n") + 1 or len(self.buffer)
+        data = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        return data
+
+    def write(self, data):
+        # Commands sent during a replay go nowhere; the recording already holds the replies
+        return len(data)
+
+    def close(self):
+        self.is_open = False
+
+def replay_to_port(log, ser, speed=1.0):
+    """Feed the outbound side of a recording to a device (real or virtual) with the original timing"""
+    player = ReplaySerial(log, speed, TrafficRecorder.OUTBOUND)
+    while not player.finished:
+        if player.in_waiting:
+            ser.write(player.read(player.in_waiting))
+        else:
+            time.sleep(0.001)
+
+# Firmware upload over the CDC link:
+#   {"DataType": 9, "Size": n, "CRC": crc32, "Block": size}  ->  {"DataType": 10, "Ready": 1}
+#   binary blocks: FW_FRAME header (magic, index, length, CRC32 of data) + data
+#                  each answered with {"DataType": 10, "Ack": index} or {"DataType": 10, "Nak": index}
+#   {"DataType": 11}  ->  {"DataType": 10, "Done": 1, "CRC": crc32 of the flashed image}
+FW_FRAME = struct.Struct("<BIHI")
+FW_FRAME_MAGIC = 0xB1
+FW_BLOCK_SIZE = 1024
+FW_WINDOW = 8          # blocks in flight before waiting for acknowledgements
+FW_MAX_RETRIES = 5
+FW_STALL_TIMEOUT = 5.0
+
+# ST DfuSe bootloader (USB DFU 1.1 with ST extensions)
+DFU_DNLOAD, DFU_UPLOAD, DFU_GETSTATUS, DFU_CLRSTATUS, DFU_ABORT = 1, 2, 3, 4, 6
+DFU_STATE_DNBUSY, DFU_STATE_ERROR = 4, 10
+DFU_FLASH_BASE = 0x08000000
+DFU_TRANSFER_SIZE = 2048
+
+def upload_firmware_cdc(device, image, progress=None):
+    """Stream an image to the device's bootloader over the CDC port, several blocks in flight"""
+    blocks = [image[i:i + FW_BLOCK_SIZE] for i in range(0, len(image), FW_BLOCK_SIZE)]
+    image_crc = zlib.crc32(image) & 0xFFFFFFFF
+    frames = [FW_FRAME.pack(FW_FRAME_MAGIC, i, len(b), zlib.crc32(b) & 0xFFFFFFFF) + b
+              for i, b in enumerate(blocks)]
+
+    with serial.Serial(device, 115200, timeout=0.05) as ser:
+        def replies(deadline):
+            while time.monotonic() < deadline:
+                line = ser.readline().decode(errors='ignore').strip()
+                if line.startswith("{") and line.endswith("}"):
+                    try:
+                        data = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if data.get("DataType") == 10:
+                        yield data
+
+        ser.write((json.dumps({"DataType": 9, "Size": len(image), "CRC": image_crc,
+                               "Block": FW_BLOCK_SIZE}) + "\n").encode())
+        if not any(r.get("Ready") for r in replies(time.monotonic() + FW_STALL_TIMEOUT)):
+            raise Exception("bootloader did not answer")
+
+        unacked = set()
+        retries = collections.Counter()
+        next_block = done = 0
+        last_progress = time.monotonic()
+        while done < len(blocks):
+            while next_block < len(blocks) and len(unacked) < FW_WINDOW:
+                ser.write(frames[next_block])
+                unacked.add(next_block)
+                next_block += 1
+            line = ser.readline().decode(errors='ignore').strip()
+            try:
+                data = json.loads(line) if line.startswith("{") else {}
+            except json.JSONDecodeError:
+                data = {}
+            if data.get("Ack") in unacked:
+                unacked.discard(data["Ack"])
+                done += 1
+                last_progress = time.monotonic()
+                if progress:
+                    progress(done, len(blocks))
+            elif data.get("Nak") in unacked:
+                retries[data["Nak"]] += 1
+                if retries[data["Nak"]] > FW_MAX_RETRIES:
+                    raise Exception(f"block {data['Nak']} rejected {FW_MAX_RETRIES} times")
+                ser.write(frames[data["Nak"]])
+            elif time.monotonic() - last_progress > FW_STALL_TIMEOUT:
+                raise Exception(f"no acknowledgement after block {done}")
+
+        ser.write((json.dumps({"DataType": 11}) + "\n").encode())
+        for data in replies(time.monotonic() + FW_STALL_TIMEOUT):
+            if data.get("Done"):
+                if data.get("CRC") != image_crc:
+                    raise Exception(f"verify failed: device CRC {data.get('CRC')}, image CRC {image_crc}")
+                return
+        raise Exception("bootloader did not confirm the image")
+
+def upload_firmware_dfu(dev, image, progress=None, address=DFU_FLASH_BASE):
+    """Flash an image through the ST DfuSe bootloader (0x0483:0xDF11) using pyusb"""
+    def status():
+        s = dev.ctrl_transfer(0xA1, DFU_GETSTATUS, 0, 0, 6)
+        time.sleep((s[1] | s[2] << 8 | s[3] << 16) / 1000)
+        return s[0], s[4]
+
+    def wait_idle():
+        while True:
+            code, state = status()
+            if code:
+                raise Exception(f"DFU error status {code}")
+            if state != DFU_STATE_DNBUSY:
+                return
+
+    def dnload(block, data):
+        dev.ctrl_transfer(0x21, DFU_DNLOAD, block, 0, data)
+        wait_idle()
+
+    def set_address(addr):
+        dnload(0, struct.pack("<BI", 0x21, addr))
+
+    if status()[1] == DFU_STATE_ERROR:
+        dev.ctrl_transfer(0x21, DFU_CLRSTATUS, 0, 0, None)
+    dev.ctrl_transfer(0x21, DFU_ABORT, 0, 0, None)
+
+    dnload(0, bytes([0x41]))  # mass erase
+    set_address(address)
+    chunks = [image[i:i + DFU_TRANSFER_SIZE] for i in range(0, len(image), DFU_TRANSFER_SIZE)]
+    for i, chunk in enumerate(chunks):
+        dnload(i + 2, chunk)
+        if progress:
+            progress(i + 1, len(chunks) * 2)
+
+    # Read back and compare before leaving the bootloader
+    set_address(address)
+    dev.ctrl_transfer(0x21, DFU_ABORT, 0, 0, None)
+    readback = bytearray()
+    for i, chunk in enumerate(chunks):
+        readback += bytes(dev.ctrl_transfer(0xA1, DFU_UPLOAD, i + 2, 0, DFU_TRANSFER_SIZE))
+        if progress:
+            progress(len(chunks) + i + 1, len(chunks) * 2)
+    if zlib.crc32(bytes(readback[:len(image)])) != zlib.crc32(image):
+        raise Exception("verify failed: read-back does not match the image")
+
+    dev.ctrl_transfer(0x21, DFU_ABORT, 0, 0, None)
+    set_address(address)
+    dev.ctrl_transfer(0x21, DFU_DNLOAD, 0, 0, None)  # zero-length download: leave DFU and run
+    try:
+        status()
+    except Exception:
+        pass  # the device resets while answering
+
+def dfu_devices():
+    if not USB_AVAILABLE:
+        return []
+    return list(usb.core.find(find_all=True, idVendor=STM32_DFU_ID[0], idProduct=STM32_DFU_ID[1]))
+
+class FirmwareFlasher(QObject):
+    """Flashes several devices in parallel and reports per-device progress"""
+    progress = pyqtSignal(str, int, int)
+    finished = pyqtSignal(object)
+
+    def start(self, image, targets, ready=None):
+        """targets: list of (name, "cdc" device path or "dfu" pyusb device).
+        ready, if given, is called on the worker thread before any device is opened."""
+        threading.Thread(target=self.run, args=(image, targets, ready), daemon=True).start()
+
+    def run(self, image, targets, ready=None):
+        if ready:
+            ready()
+        with ThreadPoolExecutor(max_workers=max(1, len(targets))) as executor:
+            results = list(executor.map(lambda t: self.flash(image, *t), targets))
+        self.finished.emit(results)
+
+    def flash(self, image, name, kind, target):
+        report = lambda done, total: self.progress.emit(name, done, total)
+        started = time.monotonic()
+        try:
+            if kind == "dfu":
+                upload_firmware_dfu(target, image, report)
+            else:
+                upload_firmware_cdc(target, image, report)
+        except Exception as e:
+            return name, str(e)
+        return name, f"OK ({time.monotonic() - started:.1f} s)"
+
+class BootloaderStandIn:
+    """Plays the CDC bootloader on a pseudo-terminal so uploads can be exercised without hardware.
+    nak_every > 0 rejects the first transmission of every n-th block, to exercise retransmission."""
+    def __init__(self, nak_every=0):
+        self.master, slave = os.openpty()
+        self.device = os.ttyname(slave)
+        tty.setraw(slave)
+        self.nak_every = nak_every
+        self.image = None
+        self.expected = None
+        self.rejected = set()
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def reply(self, data):
+        os.write(self.master, (json.dumps(data) + "\n").encode())
+
+    def serve(self):
+        buf = b""
+        while True:
+            buf += os.read(self.master, 65536)
+            while buf:
+                if buf[0] == FW_FRAME_MAGIC:
+                    if len(buf) < FW_FRAME.size:
+                        break
+                    _, index, length, crc = FW_FRAME.unpack_from(buf)
+                    if len(buf) < FW_FRAME.size + length:
+                        break
+                    data, buf = buf[FW_FRAME.size:FW_FRAME.size + length], buf[FW_FRAME.size + length:]
+                    self.block(index, data, crc)
+                elif b"\n" in buf:
+                    line, buf = buf.split(b"\n", 1)
+                    try:
+                        self.command(json.loads(line))
+                    except (ValueError, AttributeError):
+                        pass
+                else:
+                    break
+
+    def command(self, cmd):
+        if cmd.get("DataType") == 7:
+            reply = {"DataType": 8, "Version": "bootloader-standin"}
+            if "Seq" in cmd:
+                reply["Seq"] = cmd["Seq"]
+            self.reply(reply)
+        elif cmd.get("DataType") == 9:
+            self.image = bytearray(cmd["Size"])
+            self.expected = cmd["CRC"]
+            self.block_size = cmd["Block"]
+            self.rejected = set()
+            self.reply({"DataType": 10, "Ready": 1})
+        elif cmd.get("DataType") == 11:
+            self.reply({"DataType": 10, "Done": 1, "CRC": zlib.crc32(bytes(self.image)) & 0xFFFFFFFF})
+
+    def block(self, index, data, crc):
+        inject = self.nak_every and (index + 1) % self.nak_every == 0 and index not in self.rejected
+        if zlib.crc32(data) & 0xFFFFFFFF != crc or inject:
+            self.rejected.add(index)
+            self.reply({"DataType": 10, "Nak": index})
+            return
+        start = index * self.block_size
+        self.image[start:start + len(data)] = data
+        self.reply({"DataType": 10, "Ack": index})
+
+class StreamDecoder:
+    """Incremental decoder for the newline-terminated JSON objects the device sends.
+    Bytes are consumed as they arrive and feed() returns events:
+      ("item", key, index, value, partial object)   one element of a top-level array
+      ("end", object, errors)                       object complete (or cut short by a newline)
+    Each array element and top-level value is decoded on its own, so a corrupted element
+    becomes None and costs one row instead of the whole response. Garbage between objects
+    is skipped until the next "{"."""
+    MAX_TOKEN = 4096
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.state = "seek"
+        self.obj = None
+        self.errors = 0
+        self.key = None
+        self.index = 0
+        self.raw = bytearray()
+        self.in_string = False
+        self.escape = False
+        self.depth = 0
+
+    def decode(self, raw):
+        try:
+            # strict=False: a stray control byte inside a string costs nothing
+            return json.loads(raw.decode(errors="replace"), strict=False)
+        except ValueError:
+            self.errors += 1
+            return None
+
+    def finish(self, events, complete=True):
+        if not complete:
+            self.errors += 1
+        events.append(("end", self.obj, self.errors))
+        self.reset()
+
+    def feed(self, data):
+        events = []
+        for b in data:
+            state = self.state
+            if b == 0x0A:  # newline always ends a message
+                if state != "seek":
+                    if state in ("scalar", "element") and self.raw.strip():
+                        self.store(events)
+                    self.finish(events, complete=False)
+                continue
+            if state == "seek":
+                if b == 0x7B:  # {
+                    self.obj, self.errors, self.state = {}, 0, "object"
+            elif state == "object":
+                if b == 0x22:  # start of a key
+                    self.raw, self.in_string, self.state = bytearray(b'"'), True, "key"
+                elif b == 0x7D:  # }
+                    self.finish(events)
+            elif state == "key":
+                self.raw.append(b)
+                if self.escape:
+                    self.escape = False
+                elif b == 0x5C:
+                    self.escape = True
+                elif b == 0x22:
+                    self.in_string = False
+                    self.key = self.decode(bytes(self.raw))
+                    if isinstance(self.key, str):
+                        # Line noise inside a key name: drop the control characters and keep the key
+                        self.key = "".join(ch for ch in self.key if ch >= " ")
+                        self.state = "colon"
+                    else:
+                        self.finish(events, complete=False)
+            elif state == "colon":
+                if b == 0x3A:
+                    self.state = "value"
+            elif state == "value":
+                if b == 0x5B:  # [
+                    self.obj[self.key] = []
+                    self.index = 0
+                    self.raw, self.depth, self.state = bytearray(), 0, "element"
+                elif b not in b" \t\r":
+                    self.raw, self.depth, self.state = bytearray(), 0, "scalar"
+                    self.token(b, events)
+            else:  # "scalar", "element" or "after"
+                if state == "after":
+                    if b == 0x2C:
+                        self.state = "object"
+                    elif b == 0x7D:
+                        self.finish(events)
+                else:
+                    self.token(b, events)
+        return events
+
+    def token(self, b, events):
+        # Collect one value, tracking strings and nesting to find where it ends
+        if self.in_string:
+            self.raw.append(b)
+            if self.escape:
+                self.escape = False
+            elif b == 0x5C:
+                self.escape = True
+            elif b == 0x22:
+                self.in_string = False
+            return
+        if self.depth == 0 and b in b",]}":
+            element = self.state == "element"
+            if self.raw.strip() or not element:
+                self.store(events)
+            if element and b == 0x2C:
+                self.raw = bytearray()
+            elif element and b == 0x5D:
+                self.state = "after"
+            elif b == 0x7D:
+                self.finish(events)
+            else:
+                self.state = "object"
+            return
+        self.raw.append(b)
+        if b == 0x22:
+            self.in_string = True
+        elif b in b"[{":
+            self.depth += 1
+        elif b in b"]}":
+            self.depth -= 1
+        if len(self.raw) > self.MAX_TOKEN:
+            # Runaway value (lost quote or bracket): give up on this message
+            self.finish(events, complete=False)
+
+    def store(self, events):
+        value = self.decode(bytes(self.raw))
+        if self.state == "element":
+            self.obj[self.key].append(value)
+            events.append(("item", self.key, self.index, value, self.obj))
+            self.index += 1
+        else:
+            self.obj[self.key] = value
+
+def damaged_register_rows(data):
+    """Rows of a register reply that lost a value to line noise or were cut short"""
+    columns = [data[key] for key in REGISTER_KEYS if isinstance(data.get(key), list)]
+    count = max((len(c) for c in columns), default=0)
+    return [i for i in range(count) if not all(i < len(c) and c[i] is not None for c in columns)]
+
+def drop_damaged_registers(data):
+    """Register reply with the damaged rows removed (later rows move up)"""
+    damaged = set(damaged_register_rows(data))
+    if not damaged:
+        return data
+    count = max(len(data[key]) for key in REGISTER_KEYS if isinstance(data.get(key), list))
+    keep = [i for i in range(count) if i not in damaged]
+    return dict(data, **{key: [data[key][i] for i in keep] for key in REGISTER_KEYS if key in data})
+
+def register_value_digits(function, width):
+    # Coils and discrete inputs publish 0/1; registers up to their unsigned maximum
+    return 1 if function in (1, 2) else len(str(2 ** (8 * width) - 1))
+
+def mqtt_payload(config, registers, worst_case=True):
+    """The JSON the device publishes every Interval: site, panel and one value per register"""
+    message = {"SiteName": config.get("SiteName", ""), "PanelName": config.get("PanelName", "")}
+    for name, function, width in zip(registers.name_list(), registers.functions, registers.widths):
+        message[name] = int("9" * register_value_digits(function, width)) if worst_case else 0
+    return json.dumps(message, separators=(",", ":")).encode()
+
+def simulated_reading(config, registers):
+    """A message as a running device would publish it: each register holds a random value within its width.
+    Built independently of mqtt_payload, so a measurement does not just echo the estimate back."""
+    message = {"SiteName": config.get("SiteName", ""), "PanelName": config.get("PanelName", "")}
+    for name, function, width in zip(registers.name_list(), registers.functions, registers.widths):
+        message[name] = random.randint(0, 1) if function in (1, 2) else random.randrange(2 ** (8 * width))
+    return json.dumps(message, separators=(",", ":")).encode()
+
+def mqtt_remaining_length(n):
+    out = bytearray()
+    while True:
+        n, digit = n // 128, n % 128
+        out.append(digit | (0x80 if n else 0))
+        if not n:
+            return bytes(out)
+
+def mqtt_publish_packet(topic, payload):
+    """MQTT 3.1.1 PUBLISH at QoS 0"""
+    body = struct.pack(">H", len(topic.encode())) + topic.encode() + payload
+    return b"\x30" + mqtt_remaining_length(len(body)) + body
+
+def estimate_mqtt(config, registers):
+    interval = max(1, int(config.get("Interval") or 1))
+    topic = config.get("PubTopic", "")
+    worst = mqtt_publish_packet(topic, mqtt_payload(config, registers))
+    best = mqtt_publish_packet(topic, mqtt_payload(config, registers, worst_case=False))
+    return {
+        "registers": len(registers),
+        "interval": interval,
+        "packet_min": len(best),
+        "packet_max": len(worst),
+        "messages_per_s": 1 / interval,
+        "bytes_per_s": len(worst) / interval,
+    }
+
+def mqtt_estimate_report(estimates):
+    """estimates: list of (device name, estimate_mqtt result)"""
+    lines = [f"{'device':<28}{'regs':>6}{'every':>8}{'packet B':>14}{'msg/s':>9}{'B/s':>10}"]
+    for name, e in estimates:
+        lines.append(f"{name[:27]:<28}{e['registers']:>6}{e['interval']:>7}s"
+                     f"{e['packet_min']:>7}-{e['packet_max']:<6}{e['messages_per_s']:>9.3f}{e['bytes_per_s']:>10.1f}")
+    if len(estimates) > 1:
+        msgs = sum(e["messages_per_s"] for _, e in estimates)
+        rate = sum(e["bytes_per_s"] for _, e in estimates)
+        lines.append(f"{'fleet total':<28}{'':>6}{'':>8}{'':>14}{msgs:>9.3f}{rate:>10.1f}")
+    lines.append("")
+    lines.append("Packet sizes are MQTT 3.1.1 PUBLISH at QoS 0; B/s uses the largest possible values.")
+    return "\n".join(lines)
+
+class MqttBrokerStandIn:
+    """Minimal local MQTT 3.1.1 broker that accepts connections and measures what is published"""
+    def __init__(self, host="127.0.0.1", port=0):
+        self.publishes = []  # (monotonic time, topic, packet bytes, payload bytes)
+        self.lock = threading.Lock()
+        broker = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def read_exact(self, n):
+                data = b""
+                while len(data) < n:
+                    chunk = self.request.recv(n - len(data))
+                    if not chunk:
+                        raise ConnectionError
+                    data += chunk
+                return data
+
+            def handle(self):
+                try:
+                    while True:
+                        first = self.read_exact(1)[0]
+                        length = shift = 0
+                        header = 1
+                        while True:
+                            digit = self.read_exact(1)[0]
+                            header += 1
+                            length += (digit & 0x7F) << shift
+                            shift += 7
+                            if not digit & 0x80:
+                                break
+                        body = self.read_exact(length)
+                        kind = first >> 4
+                        if kind == 1:      # CONNECT
+                            self.request.sendall(b"\x20\x02\x00\x00")
+                        elif kind == 3:    # PUBLISH
+                            qos = (first >> 1) & 3
+                            topic_len = struct.unpack_from(">H", body)[0]
+                            topic = body[2:2 + topic_len].decode(errors="replace")
+                            payload_start = 2 + topic_len + (2 if qos else 0)
+                            with broker.lock:
+                                broker.publishes.append((time.monotonic(), topic, header + length,
+                                                         length - payload_start))
+                            if qos == 1:
+                                self.request.sendall(b"\x40\x02" + body[2 + topic_len:4 + topic_len])
+                        elif kind == 8:    # SUBSCRIBE: grant QoS 0 to every filter
+                            count = 0
+                            pos = 2
+                            while pos < len(body):
+                                pos += 2 + struct.unpack_from(">H", body, pos)[0] + 1
+                                count += 1
+                            self.request.sendall(bytes([0x90, 2 + count]) + body[:2] + b"\x00" * count)
+                        elif kind == 12:   # PINGREQ
+                            self.request.sendall(b"\xd0\x00")
+                        elif kind == 14:   # DISCONNECT
+                            return
+                except (ConnectionError, OSError):
+                    return
+
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.address = self.server.server_address
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stats(self):
+        """Per topic: message count, average packet size, payload size and message rate"""
+        with self.lock:
+            publishes = list(self.publishes)
+        result = {}
+        for topic in sorted({p[1] for p in publishes}):
+            rows = [p for p in publishes if p[1] == topic]
+            span = rows[-1][0] - rows[0][0]
+            result[topic] = {
+                "messages": len(rows),
+                "packet_bytes": sum(p[2] for p in rows) / len(rows),
+                "payload_bytes": sum(p[3] for p in rows) / len(rows),
+                "messages_per_s": (len(rows) - 1) / span if span > 0 else 0.0,
+            }
+        return result
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def simulate_publisher(address, topic, payload, interval, count):
+    """Act as a device: connect and publish count messages, interval seconds apart.
+    payload is the message bytes, or a function returning the next message."""
+    with socket.create_connection(address, timeout=5.0) as sock:
+        client_id = b"iot-configurator-sim"
+        body = b"\x00\x04MQTT\x04\x02\x00\x3c" + struct.pack(">H", len(client_id)) + client_id
+        sock.sendall(b"\x10" + mqtt_remaining_length(len(body)) + body)
+        sock.recv(4)  # CONNACK
+        for i in range(count):
+            if i:
+                time.sleep(interval)
+            sock.sendall(mqtt_publish_packet(topic, payload() if callable(payload) else payload))
+        sock.sendall(b"\xe0\x00")
+
+class MqttMeasurer(QObject):
+    """Publishes through a broker stand-in as a simulated device, off the GUI thread.
+    The device Interval is shortened by speedup, and capped so a measurement takes seconds.
+    payload is passed on to simulate_publisher (bytes, or a function building each message)."""
+    finished = pyqtSignal(object)
+    MAX_SIMULATED_INTERVAL = 0.5
+
+    def start(self, topic, payload, interval, count=5, speedup=100):
+        threading.Thread(target=self.run, args=(topic, payload, interval, count, speedup), daemon=True).start()
+
+    def run(self, topic, payload, interval, count, speedup):
+        simulated = min(interval / speedup, self.MAX_SIMULATED_INTERVAL)
+        result = {"topic": topic, "speedup": interval / simulated if simulated > 0 else speedup,
+                  "measured": None, "error": None}
+        broker = MqttBrokerStandIn()
+        try:
+            simulate_publisher(broker.address, topic, payload, simulated, count)
+            time.sleep(0.1)
+            result["measured"] = broker.stats().get(topic)
+        except OSError as e:
+            result["error"] = str(e)
+        finally:
+            broker.close()
+        self.finished.emit(result)
+
+class UpdateServerStandIn:
+    """Serves a directory as a GitHub-style latest release, for trying updates locally.
+    The directory holds VERSION (the tag) and the release assets (zip, SHA256SUMS, *.bsdiff).
+    Point the application at it with IOT_CONFIGURATOR_UPDATE_API=http://host:port."""
+    def __init__(self, directory, host="127.0.0.1", port=0):
+        self.directory = os.path.abspath(directory)
+        standin = self
+
+        class Handler(SimpleHTTPRequestHandler):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, directory=standin.directory, **kwargs)
+
+            def do_GET(self):
+                if self.path.endswith("/releases/latest"):
+                    payload = json.dumps(standin.release(self.headers.get("Host"))).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                else:
+                    super().do_GET()
+
+            def log_message(self, fmt, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.address = self.server.server_address
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def release(self, host):
+        with open(os.path.join(self.directory, "VERSION")) as f:
+            tag = f.read().strip()
+        names = sorted(n for n in os.listdir(self.directory) if n != "VERSION")
+        return {
+            "tag_name": tag,
+            "html_url": f"http://{host}/",
+            "body": f"Local test release {tag}",
+            "assets": [{"name": n, "browser_download_url": f"http://{host}/{urllib.parse.quote(n)}"} for n in names],
+        }
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class SerialSession:
+    """Long-lived connection to one device. Requests queue on the lock, one exchange at a time."""
+    def __init__(self, device):
+        self.device = device
+        self.ser = None
+        self.next_seq = 1
+        self.lock = threading.Lock()
+
+    def request(self, commands, timeout=3.0):
+        with self.lock:
+            for attempt in (1, 2):
+                seq = self.next_seq
+                self.next_seq = (seq - 1 + len(commands)) % 65535 + 1
+                try:
+                    if self.ser is None:
+                        self.ser = serial.Serial(self.device, 115200, timeout=0.1)
+                    self.ser.reset_input_buffer()
+                    return exchange(self.ser, commands, timeout, first_seq=seq)
+                except (serial.SerialException, OSError):
+                    # Stale handle (device reset or re-plugged): reopen once
+                    self.close()
+                    if attempt == 2:
+                        raise
+
+    def send(self, cmd):
+        with self.lock:
+            if self.ser is None:
+                self.ser = serial.Serial(self.device, 115200, timeout=0.1)
+            try:
+                write_command(self.ser, cmd)
+            except (serial.SerialException, OSError):
+                self.close()
+                raise
+
+    def verify(self, section, expected):
+        """Checksum compare, falling back to a full read; returns the list of differences"""
+        crc = config_checksum(expected)
+        reply = self.request([{"DataType": 5, "Section": section}], timeout=1.0)[0]
+        if reply and reply.get("CRC") == crc:
+            return []
+        reply = self.request([{"DataType": section}])[0]
+        if reply is None:
+            raise TimeoutError("device did not answer the read-back")
+        return config_differences(expected, normalize_device_reply(expected, reply))
+
+    def close(self):
+        if self.ser:
+            try:
+                self.ser.close()
+            except Exception:
+                pass
+        self.ser = None
+
+class AutomationDaemon:
+    """Local HTTP/JSON API over persistent sessions to the attached devices.
+      GET  /ports                      attached devices
+      GET  /ports/<port>/config        device configuration (DataType 1)
+      PUT  /ports/<port>/config        write configuration (DataType 2); ?verify=1 checks it landed
+      GET  /ports/<port>/modbus        register map (DataType 3)
+      PUT  /ports/<port>/modbus        write register map (DataType 4); ?verify=1 as above
+    <port> is the device name (ttyACM0, COM3) or its USB serial number."""
+    def __init__(self, host="127.0.0.1", port=8765):
+        self.sessions = {}
+        self.known = {}  # device name, path and serial number -> port info, from the last enumeration
+        self.lock = threading.Lock()
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                daemon.handle(self, "GET")
+
+            def do_PUT(self):
+                daemon.handle(self, "PUT")
+
+            def log_message(self, fmt, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+
+    def ports(self):
+        ports = [p for p in serial.tools.list_ports.comports() if is_stm32_port(p)]
+        known = {}
+        for p in ports:
+            for name in (os.path.basename(p.device), p.device, getattr(p, 'serial_number', None)):
+                if name:
+                    known[name] = p
+        with self.lock:
+            self.known = known
+        return ports
+
+    def session(self, name):
+        # Enumerating ports is slow on some hosts; only look again for a name not seen before
+        with self.lock:
+            p = self.known.get(name)
+        if p is None:
+            self.ports()
+            with self.lock:
+                p = self.known.get(name)
+        if p is None:
+            raise LookupError(f"no device {name}")
+        if is_dfu_port(p):
+            raise LookupError(f"{name} is in DFU mode")
+        with self.lock:
+            if p.device not in self.sessions:
+                self.sessions[p.device] = SerialSession(p.device)
+            return self.sessions[p.device]
+
+    def handle(self, request, method):
+        url = urllib.parse.urlsplit(request.path)
+        parts = [urllib.parse.unquote(x) for x in url.path.strip("/").split("/")]
+        verify = urllib.parse.parse_qs(url.query).get("verify", ["0"])[0] not in ("0", "")
+        try:
+            if method == "GET" and parts == ["ports"]:
+                body = [{"port": os.path.basename(p.device), "device": p.device,
+                         "serial_number": getattr(p, 'serial_number', None), "dfu": is_dfu_port(p)}
+                        for p in self.ports()]
+            elif len(parts) == 3 and parts[0] == "ports" and parts[2] in ("config", "modbus"):
+                session = self.session(parts[1])
+                section = 1 if parts[2] == "config" else 3
+                if method == "GET":
+                    reply = session.request([{"DataType": section}])[0]
+                    if reply is None:
+                        raise TimeoutError("device did not answer")
+                    body = canonical_config(reply) if section == 1 else canonical_registers(reply)
+                else:
+                    length = int(request.headers.get("Content-Length", 0))
+                    data = json.loads(request.rfile.read(length) or b"{}")
+                    data = validate_config(data) if section == 1 else validate_registers(data)
+                    session.send(dict({"DataType": section + 1}, **data))
+                    body = {"ok": True}
+                    if verify:
+                        diffs = session.verify(section, data)
+                        body = {"ok": not diffs, "differences": diffs}
+            else:
+                raise LookupError(f"no route {method} {url.path}")
+            status = 200
+        except LookupError as e:
+            status, body = 404, {"error": str(e)}
+        except (ValueError, KeyError) as e:
+            status, body = 400, {"error": f"invalid request: {e}"}
+        except TimeoutError as e:
+            status, body = 504, {"error": str(e)}
+        except (serial.SerialException, OSError) as e:
+            # The device may have been re-plugged under another name: enumerate again next time
+            with self.lock:
+                self.known = {}
+            status, body = 502, {"error": str(e)}
+        except Exception as e:
+            status, body = 500, {"error": f"internal error: {e}"}
+        payload = json.dumps(body).encode()
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(payload)))
+        request.end_headers()
+        request.wfile.write(payload)
+
+    def serve_forever(self):
+        try:
+            self.server.serve_forever()
+        finally:
+            for session in self.sessions.values():
+                session.close()
+
+class RequestTracker:
+    """Pending-request table that correlates device replies with the commands that asked for them"""
+    # Reply DataType -> request DataType, for firmware that does not echo "Seq"
+    REPLY_TO_REQUEST = {3: 3, 6: 5, 8: 7}
+    DEFAULT_TIMEOUT = 3.0
+
+    def __init__(self):
+        self.next_seq = 1
+        self.pending = {}  # seq -> [request DataType, callback, on_timeout, deadline, encoded command]
+
+    def register(self, data_type, callback, timeout=None, on_timeout=None):
+        seq = self.next_seq
+        self.next_seq = seq % 65535 + 1
+        deadline = time.monotonic() + (timeout or self.DEFAULT_TIMEOUT)
+        self.pending[seq] = [data_type, callback, on_timeout, deadline, None]
+        return seq
+
+    def sent(self, seq, line):
+        self.pending[seq][4] = line
+
+    def restart(self):
+        """Commands still awaiting a reply after a reconnect, with their timeouts restarted"""
+        now = time.monotonic()
+        for entry in self.pending.values():
+            entry[3] = now + self.DEFAULT_TIMEOUT
+        return [entry[4] for entry in self.pending.values() if entry[4]]
+
+    @classmethod
+    def request_kind(cls, data):
+        """DataType of the request a reply answers (config replies carry no reply DataType of their own)"""
+        if "DataType" not in data and "Name" in data:
+            return 3
+        return cls.REPLY_TO_REQUEST.get(data.get("DataType"), 1)
+
+    def match(self, data, reply_type=None):
+        """Sequence ID of the request a (possibly partial) reply belongs to, or None"""
+        if "Seq" in data:
+            # A stale Seq (its request expired or was answered) must not complete a newer request
+            return data["Seq"] if data["Seq"] in self.pending else None
+        # Legacy firmware: hand the reply to the oldest request of the matching kind
+        wanted = self.REPLY_TO_REQUEST.get(reply_type or data.get("DataType"), 1)
+        return next((s for s, e in self.pending.items() if e[0] == wanted), None)
+
+    def callback_for(self, data, reply_type=None):
+        seq = self.match(data, reply_type)
+        return self.pending[seq][1] if seq is not None else None
+
+    def resolve(self, data):
+        """Complete the request a reply belongs to. Returns False if nobody was waiting for it."""
+        seq = self.match(data)
+        if seq is None:
+            return False
+        self.pending.pop(seq)[1](data)
+        return True
+
+    def expire(self):
+        now = time.monotonic()
+        expired = [s for s, e in self.pending.items() if e[3] <= now]
+        for seq in expired:
+            entry = self.pending.pop(seq)
+            if entry[2]:
+                entry[2](entry[0])
+
+    def discard(self, data):
+        """Drop the request a reply that cannot be used belongs to, without completing it"""
+        seq = self.match(data)
+        if seq is not None:
+            del self.pending[seq]
+
+    def clear(self):
+        self.pending.clear()
+
+class EditHistory:
+    """Undo/redo steps over the editor cells.
+
+    The cells are held as a tuple of row tuples (row 0 is DEVICE CONFIGURATION, rows 1.. are registers).
+    A single edit is stored as a (row, column, old, new) delta; bulk operations store the before and
+    after tuples, which share every unchanged row with each other and with earlier steps."""
+    COALESCE_SECONDS = 2.0
+
+    def __init__(self, limit=5000):
+        self.undo_steps = collections.deque(maxlen=limit)
+        self.redo_steps = []
+        self.last_edit = 0.0
+
+    def record_cell(self, row, col, old, new):
+        now = time.monotonic()
+        last = self.undo_steps[-1] if self.undo_steps else None
+        # Keep typing in one cell as one step
+        if (last and len(last) == 4 and last[:2] == (row, col) and not self.redo_steps
+                and now - self.last_edit < self.COALESCE_SECONDS):
+            self.undo_steps.pop()
+            old = last[2]
+        if old != new:
+            self.undo_steps.append((row, col, old, new))
+        self.redo_steps.clear()
+        self.last_edit = now
+
+    def record_bulk(self, before, after):
+        self.undo_steps.append((before, after))
+        self.redo_steps.clear()
+        self.last_edit = 0.0
+
+    def undo(self):
+        step = self.undo_steps.pop()
+        self.redo_steps.append(step)
+        self.last_edit = 0.0
+        return step, False
+
+    def redo(self):
+        step = self.redo_steps.pop()
+        self.undo_steps.append(step)
+        self.last_edit = 0.0
+        return step, True
+
+class Profiler:
+    """Low-overhead timers around the UI hot paths, written out as a Chrome trace on exit"""
+    HOT_PATHS = [
+        "read_from_serial", "update_fields", "load_modbus_table", "check_fields_for_data",
+        "send_config_json", "send_modbus_json", "save_config", "load_config",
+        "refresh_ports", "set_theme"
+    ]
+    STALL_CHECK_MS = 50
+    MAX_EVENTS = 200000
+
+    def __init__(self, trace_path, cprofile_path=None):
+        self.trace_path = trace_path
+        self.cprofile_path = cprofile_path
+        self.cprofile = cProfile.Profile() if cprofile_path else None
+        self.events = collections.deque(maxlen=self.MAX_EVENTS)  # (name, start_ns, dur_ns, thread)
+        self.stats = {}  # name -> [calls, total_ns, max_ns]
+        self.origin = time.perf_counter_ns()
+        self.stall_timer = None
+        self.last_tick = None
+
+    def wrap(self, name, func):
+        # Qt calls slots with however many signal arguments the slot accepts; keep that behaviour
+        code = func.__code__
+        nargs = None if code.co_flags & 0x04 else code.co_argcount
+        clock = time.perf_counter_ns
+        stats = self.stats.setdefault(name, [0, 0, 0])
+        events = self.events
+
+        @functools.wraps(func)
+        def timed(*args):
+            start = clock()
+            try:
+                return func(*args[:nargs])
+            finally:
+                dur = clock() - start
+                stats[0] += 1
+                stats[1] += dur
+                if dur > stats[2]:
+                    stats[2] = dur
+                events.append((name, start, dur, threading.get_ident()))
+        return timed
+
+    def instrument(self, cls):
+        for name in self.HOT_PATHS:
+            setattr(cls, name, self.wrap(name, getattr(cls, name)))
+
+    def start(self):
+        # A timer that fires late means the event loop was blocked for the difference
+        self.stall_timer = QTimer()
+        self.stall_timer.timeout.connect(self.check_stall)
+        self.last_tick = time.perf_counter_ns()
+        self.stall_timer.start(self.STALL_CHECK_MS)
+        if self.cprofile:
+            self.cprofile.enable()
+
+    def check_stall(self):
+        now = time.perf_counter_ns()
+        late = now - self.last_tick - self.STALL_CHECK_MS * 1000000
+        self.last_tick = now
+        if late > self.STALL_CHECK_MS * 1000000:
+            stats = self.stats.setdefault("event loop stall", [0, 0, 0])
+            stats[0] += 1
+            stats[1] += late
+            stats[2] = max(stats[2], late)
+            self.events.append(("event loop stall", now - late, late, threading.get_ident()))
+
+    def write(self):
+        if self.stall_timer:
+            self.stall_timer.stop()
+        if self.cprofile:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(self.cprofile_path)
+        pid = os.getpid()
+        trace = [
+            {"name": name, "cat": "stall" if name == "event loop stall" else "hot-path", "ph": "X",
+             "ts": (start - self.origin) / 1000, "dur": dur / 1000, "pid": pid, "tid": tid}
+            for name, start, dur, tid in self.events
+        ]
+        with open(self.trace_path, "w") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+        print(f"{'function':<24}{'calls':>8}{'total ms':>12}{'max ms':>10}")
+        for name, (calls, total, worst) in sorted(self.stats.items(), key=lambda kv: -kv[1][1]):
+            if calls:
+                print(f"{name:<24}{calls:>8}{total / 1e6:>12.1f}{worst / 1e6:>10.1f}")
+        print(f"Trace written to {self.trace_path}")
+
+BENCHMARK_BASELINE = "iot-configurator-benchmark.json"
+# Run-to-run spread of each metric on an unchanged tree; differences below it are never reported as regressions
+BENCHMARK_NOISE = {
+    "construct_ms": 200.0,
+    "load_table_ms": 6.0,
+    "read_table_ms": 20.0,
+    "clear_table_ms": 5.0,
+    "theme_switch_ms": 150.0,
+    "save_load_ms": 8.0,
+    "peak_rss_kb": 16384,
+}
+
+def benchmark_payload(count=MB_COUNT):
+    """A full DataType 3 reply, as the device would send it"""
+    return {
+        "DataType": 3,
+        "Name": [f"Reg{i:03d}" for i in range(count)],
+        "Address": [40001 + i for i in range(count)],
+        "Function": [i % 4 + 1 for i in range(count)],
+        "SlaveID": [i % 247 + 1 for i in range(count)],
+        "Bytes": [i % 4 + 1 for i in range(count)],
+    }
+
+def run_benchmarks(repeat=15, warmup=3):
+    """Time the UI hot paths on real USBConfigTool windows (a QApplication must exist).
+    Each time is the fastest of repeat runs in milliseconds, after warmup untimed runs (caches,
+    lazily built Qt state); peak_rss_kb is the process high-water mark.
+    Attached devices are never listed or probed, and the device cache is a throwaway file."""
+    temp_dir = tempfile.mkdtemp()
+    comports = serial.tools.list_ports.comports
+    serial.tools.list_ports.comports = lambda: []
+    try:
+        return _run_benchmarks(repeat, warmup, temp_dir)
+    finally:
+        serial.tools.list_ports.comports = comports
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def _run_benchmarks(repeat, warmup, temp_dir):
+    def timed(func, setup=None):
+        samples = []
+        for i in range(warmup + repeat):
+            if setup:
+                setup()
+            # As timeit does: no collection pauses inside the timed call
+            gc.collect()
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                func()
+                elapsed = (time.perf_counter() - start) * 1000
+            finally:
+                gc.enable()
+            if i >= warmup:
+                samples.append(elapsed)
+            QApplication.processEvents()
+        # Scheduler and GC interference only ever add time, so the minimum is the stable figure
+        return min(samples)
+
+    results = {}
+    windows = []
+    cache = os.path.join(temp_dir, "devices.json")
+    results["construct_ms"] = timed(lambda: windows.append(USBConfigTool(cache)))
+    for window in windows:
+        window.port_refresh.stop()
+    win = windows[-1]
+    win.tabs.setEnabled(True)
+    win.tabs.setCurrentIndex(1)
+    payload = benchmark_payload()
+    load = lambda: win.load_modbus_table(payload)
 
-    def validate(self, text, pos):
-        state, text, pos = super().validate(text, pos)
-        if len(text.encode('utf-8')) > self.max_bytes:
-            return (QRegExpValidator.Invalid, text, pos)
-        return (state, text, pos)
+    results["load_table_ms"] = timed(load, setup=win.clear_gui_fields)
+
+    # READ as the device answers it: the reply arrives as bytes and streams into the table cell by cell
+    recording = os.path.join(temp_dir, "reply.iotraw")
+    recorder = TrafficRecorder(recording)
+    recorder.record(TrafficRecorder.INBOUND, (json.dumps(payload) + "\n").encode())
+    recorder.close()
+    log = TrafficLog(recording)
+    def request():
+        win.clear_gui_fields()
+        win.serial = ReplaySerial(log, speed=0)
+        win.read_current_tab()
+    results["read_table_ms"] = timed(win.read_from_serial, setup=request)
+    win.serial = None
+    if win.mb_table.cellWidget(MB_COUNT - 1, 1).text() != payload["Name"][-1]:
+        raise RuntimeError("benchmark READ did not fill the table")
+
+    results["clear_table_ms"] = timed(win.clear_gui_fields, setup=load)
+    themes = ["dark", "blue", "light"]
+    results["theme_switch_ms"] = timed(lambda: [win.set_theme(t) for t in themes]) / len(themes)
+
+    # What SAVE and LOAD do once their file dialogs have returned
+    path = os.path.join(temp_dir, "benchmark.mb")
+    def round_trip():
+        encode_config_file(path, win.collect_modbus())
+        win.load_modbus_table(decode_config_file(path))
+    load()
+    results["save_load_ms"] = timed(round_trip)
+
+    if RESOURCE_AVAILABLE:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        results["peak_rss_kb"] = peak // 1024 if sys.platform == "darwin" else peak
+    for window in windows:
+        window.deleteLater()
+    return results
+
+def benchmark_regressions(results, baseline, threshold):
+    """(metric, baseline, current) for every metric more than threshold percent worse than its baseline"""
+    regressions = []
+    for name, value in results.items():
+        base = baseline.get(name)
+        if base is None or value <= base * (1 + threshold / 100):
+            continue
+        if value - base < BENCHMARK_NOISE.get(name, 0):
+            continue
+        regressions.append((name, base, value))
+    return regressions
 
 class USBConfigTool(QWidget):
-    def __init__(self):
+    def __init__(self, device_cache=DEVICE_CACHE_PATH):
         super().__init__()
         self.setWindowTitle(f"IOT Configurator v{UpdateChecker.CURRENT_VERSION}")
         self.setMinimumSize(1100, 700)
         self.serial = None
         self.fields = {}
         self.mb_table = None
+        self.requests = RequestTracker()
+        self.decoder = StreamDecoder()
+        self.streaming_rows = None  # partial object whose register rows are being shown as they arrive
+        self.outbox = collections.deque()  # [encoded command line, bytes already written]
+        self.reconnecting = False
+        self.reconnect_delay = 0
+        self.reconnect_timer = QTimer()
+        self.reconnect_timer.setSingleShot(True)
+        self.reconnect_timer.timeout.connect(self.attempt_reconnect)
+        self.recorder = None
+        self.connected_port = None
+        self.prober = DeviceProber(device_cache)
+        self.prober.identified.connect(self.device_identified)
+        self.auditor = FleetAuditor()
+        self.auditor.finished.connect(self.show_audit_report)
+        self.audit_reference = None
+        self.audit_results = []
+        self.flasher = FirmwareFlasher()
+        self.flasher.progress.connect(self.show_flash_progress)
+        self.flasher.finished.connect(self.show_flash_results)
+        self.flash_progress = {}
+        self.mqtt_measurer = MqttMeasurer()
+        self.mqtt_measurer.finished.connect(self.show_mqtt_measurement)
+        self.mqtt_estimate = None
+        self.flashed_keys = []
+        self.last_sent = {}  # (port key, read DataType 1 or 3) -> section data last written to that device
+        self.history = EditHistory()
+        self.history_muted = False  # cells written without recording (registers streaming in)
+        self.damaged_rows = set()  # table rows left empty because the last read damaged them
         self.timer = QTimer()
         self.timer.timeout.connect(self.read_from_serial)
         self.port_refresh = QTimer()
@@ -352,6 +2484,26 @@ class USBConfigTool(QWidget):
         theme_menu.addAction("Dark", lambda: self.set_theme("dark"))
         theme_menu.addAction("Blue", lambda: self.set_theme("blue"))
         
+        # Edit menu; the actions also live on the window so their shortcuts work everywhere
+        edit_menu = menubar.addMenu("Edit")
+        self.undo_action = edit_menu.addAction("Undo", self.undo)
+        self.undo_action.setShortcut(QKeySequence.Undo)
+        self.redo_action = edit_menu.addAction("Redo", self.redo)
+        redo_keys = QKeySequence.keyBindings(QKeySequence.Redo)
+        if QKeySequence("Ctrl+Y") not in redo_keys:
+            redo_keys.append(QKeySequence("Ctrl+Y"))
+        self.redo_action.setShortcuts(redo_keys)
+        self.addAction(self.undo_action)
+        self.addAction(self.redo_action)
+
+        # Device menu
+        device_menu = menubar.addMenu("Device")
+        device_menu.addAction("Read All", self.read_all)
+        device_menu.addAction("Fleet Audit...", self.start_fleet_audit)
+        device_menu.addAction("Replay Recording...", self.choose_replay)
+        device_menu.addAction("Upload Firmware...", self.upload_firmware)
+        device_menu.addAction("MQTT Load Estimate...", self.show_mqtt_estimate)
+
         # Help menu with update check
         help_menu = menubar.addMenu("Help")
         help_menu.addAction("Check for Updates", self.check_for_updates)
@@ -372,10 +2524,10 @@ class USBConfigTool(QWidget):
         self.status_label.setFixedSize(160, 30)
         top_layout.addWidget(self.status_label)
         
-        # Port combo - strictly enforce 120px width
+        # Port combo - wide enough for the device names from the prober
         self.port_combo = QComboBox()
-        self.port_combo.setMinimumWidth(140)
-        self.port_combo.setMaximumWidth(140)
+        self.port_combo.setMinimumWidth(260)
+        self.port_combo.setMaximumWidth(260)
         self.port_combo.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Fixed)
         top_layout.addWidget(self.port_combo)
         
@@ -399,6 +2551,11 @@ class USBConfigTool(QWidget):
         self.write_btn.setEnabled(False)
         top_layout.addWidget(self.write_btn)
         
+        self.verify_btn = QPushButton("VERIFY")
+        self.verify_btn.setFixedWidth(btn_width)
+        self.verify_btn.setVisible(False)
+        top_layout.addWidget(self.verify_btn)
+        
         self.reset_btn = QPushButton("CLEAR")
         self.reset_btn.setFixedWidth(btn_width)
         self.reset_btn.setVisible(False)
@@ -434,10 +2591,13 @@ class USBConfigTool(QWidget):
         self.connect_btn.clicked.connect(self.toggle_serial)
         self.read_btn.clicked.connect(self.read_current_tab)
         self.write_btn.clicked.connect(self.write_current_tab)
+        self.verify_btn.clicked.connect(self.verify_current_tab)
         self.reset_btn.clicked.connect(self.clear_gui_fields)
         self.save_btn.clicked.connect(self.save_config)
         self.load_btn.clicked.connect(self.load_config)
 
+        self.edit_values = list(self.read_cells())
+        self.update_undo_actions()
         self.refresh_ports()
 
     def check_for_updates(self):
@@ -523,106 +2683,55 @@ class USBConfigTool(QWidget):
         self.config_tab = QWidget()
         hbox = QHBoxLayout()
 
-        # Device Group
-        dev_group = QGroupBox("DEVICE")
-        dev_form = QFormLayout()
-        
-        self.fields["SSID"] = QLineEdit()
-        self.fields["SSID"].setMaxLength(32)
-        self.fields["SSID"].textChanged.connect(self.check_fields_for_data)
-        dev_form.addRow("WiFi Name:", self.fields["SSID"])
-        
-        self.fields["PASS"] = QLineEdit()
-        self.fields["PASS"].setMaxLength(32)
-        self.fields["PASS"].textChanged.connect(self.check_fields_for_data)
-        dev_form.addRow("WiFi Password:", self.fields["PASS"])
-        
-        self.fields["SiteName"] = QLineEdit()
-        self.fields["SiteName"].setMaxLength(16)
-        self.fields["SiteName"].textChanged.connect(self.check_fields_for_data)
-        dev_form.addRow("Site Name:", self.fields["SiteName"])
-        
-        self.fields["PanelName"] = QLineEdit()
-        self.fields["PanelName"].setMaxLength(16)
-        self.fields["PanelName"].textChanged.connect(self.check_fields_for_data)
-        dev_form.addRow("Panel Name:", self.fields["PanelName"])
-        
-        self.fields["Interval"] = QLineEdit()
-        self.fields["Interval"].setValidator(QIntValidator(1, 86400))
-        self.fields["Interval"].textChanged.connect(self.check_fields_for_data)
-        dev_form.addRow("Transmit Time (s):", self.fields["Interval"])
-        
-        dev_group.setLayout(dev_form)
-
-        # Modbus Group
-        modbus_group = QGroupBox("MODBUS")
-        mod_form = QFormLayout()
-        
-        self.fields["BaudRate"] = QComboBox()
-        self.fields["BaudRate"].addItems(["9600", "19200", "38400", "57600", "115200"])
-        self.fields["BaudRate"].currentIndexChanged.connect(self.check_fields_for_data)
-        mod_form.addRow("Baud Rate:", self.fields["BaudRate"])
-        
-        self.fields["StopBit"] = QComboBox()
-        self.fields["StopBit"].addItems(["1", "2"])
-        self.fields["StopBit"].currentIndexChanged.connect(self.check_fields_for_data)
-        mod_form.addRow("Stop Bit:", self.fields["StopBit"])
-        
-        self.fields["Parity"] = QComboBox()
-        self.fields["Parity"].addItems(["None", "Odd", "Even"])
-        self.fields["Parity"].currentIndexChanged.connect(self.check_fields_for_data)
-        mod_form.addRow("Parity:", self.fields["Parity"])
-        
-        modbus_group.setLayout(mod_form)
+        # Device, Modbus and MQTT groups, generated from CONFIG_SCHEMA
+        forms = {}
+        for name in CONFIG_GROUPS:
+            group = QGroupBox(name)
+            forms[name] = QFormLayout()
+            group.setLayout(forms[name])
+            hbox.addWidget(group)
 
-        # MQTT Group (without Client ID)
-        mqtt_group = QGroupBox("MQTT")
-        mqtt_form = QFormLayout()
-        
-        self.fields["IP"] = QLineEdit()
-        self.fields["IP"].setMaxLength(32)
-        self.fields["IP"].textChanged.connect(self.check_fields_for_data)
-        mqtt_form.addRow("IP Address:", self.fields["IP"])
-        
-        self.fields["Port"] = QLineEdit()
-        self.fields["Port"].setValidator(QIntValidator(0, 65535))
-        self.fields["Port"].textChanged.connect(self.check_fields_for_data)
-        mqtt_form.addRow("Port:", self.fields["Port"])
-        
-        self.fields["mqttUser"] = QLineEdit()
-        self.fields["mqttUser"].setMaxLength(32)
-        self.fields["mqttUser"].textChanged.connect(self.check_fields_for_data)
-        mqtt_form.addRow("Username:", self.fields["mqttUser"])
-        
-        self.fields["mqttPass"] = QLineEdit()
-        self.fields["mqttPass"].setMaxLength(32)
-        self.fields["mqttPass"].textChanged.connect(self.check_fields_for_data)
-        mqtt_form.addRow("Password:", self.fields["mqttPass"])
-        
-        self.fields["PubTopic"] = QLineEdit()
-        self.fields["PubTopic"].setMaxLength(32)
-        self.fields["PubTopic"].textChanged.connect(self.check_fields_for_data)
-        mqtt_form.addRow("Publish Topic:", self.fields["PubTopic"])
-        
-        self.fields["SubTopic"] = QLineEdit()
-        self.fields["SubTopic"].setMaxLength(32)
-        self.fields["SubTopic"].textChanged.connect(self.check_fields_for_data)
-        mqtt_form.addRow("Subscribe Topic:", self.fields["SubTopic"])
-        
-        mqtt_group.setLayout(mqtt_form)
+        self.field_readers = []
+        self.field_writers = {}
+        self.field_checks = []
+        self.field_clearers = []
+        for spec in CONFIG_SCHEMA:
+            widget = spec.create_widget(self.check_fields_for_data)
+            self.fields[spec.key] = widget
+            forms[spec.group].addRow(spec.label, widget)
+            self.field_readers.append((spec.key, spec.to_wire(widget)))
+            self.field_writers[spec.key] = spec.from_wire(widget)
+            self.field_checks.append(spec.has_data(widget))
+            self.field_clearers.append(spec.clearer(widget))
+        # Undo/redo cells: row 0 is this tab, rows 1.. are the register rows
+        self.edit_cells = [[self.fields[spec.key] for spec in CONFIG_SCHEMA]]
 
-        hbox.addWidget(dev_group)
-        hbox.addWidget(modbus_group)
-        hbox.addWidget(mqtt_group)
         self.config_tab.setLayout(hbox)
         self.tabs.addTab(self.config_tab, "DEVICE CONFIGURATION")
 
         # Modbus Registers Tab
         self.mb_tab = QWidget()
         vbox = QVBoxLayout()
+
+        # Filter bar
+        filter_layout = QHBoxLayout()
+        self.mb_filter = QLineEdit()
+        self.mb_filter.setPlaceholderText("Filter: name, ^prefix, slave:1, fc:3, addr:100-200, #row  (Enter jumps to the first match)")
+        self.mb_filter.textChanged.connect(self.apply_register_filter)
+        self.mb_filter.returnPressed.connect(self.jump_to_match)
+        filter_layout.addWidget(self.mb_filter)
+        self.mb_filter_count = QLabel("")
+        filter_layout.addWidget(self.mb_filter_count)
+        vbox.addLayout(filter_layout)
+
         self.mb_table = QTableWidget(MB_COUNT, 5)
         self.mb_table.setHorizontalHeaderLabels(["Slave ID", "JSON Name", "Read Address", "Function", "Bytes"])
         self.mb_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.mb_table.horizontalHeader().setSectionsClickable(True)
+        self.mb_table.horizontalHeader().sectionClicked.connect(self.sort_registers)
+        self.mb_index = RegisterIndex()
+        self.mb_hidden = set()
+        self.mb_sort = None
 
         # Create validators
         slave_validator = QIntValidator(0, 247, self)
@@ -657,13 +2766,216 @@ class USBConfigTool(QWidget):
             bytes_combo.currentIndexChanged.connect(self.check_fields_for_data)
             self.mb_table.setCellWidget(row, 4, bytes_combo)
 
+            # Keep the search index current, one row at a time
+            reindex = lambda *_, row=row: self.index_register_row(row)
+            slave_edit.textChanged.connect(reindex)
+            name_edit.textChanged.connect(reindex)
+            addr_edit.textChanged.connect(reindex)
+            func_combo.currentIndexChanged.connect(reindex)
+            bytes_combo.currentIndexChanged.connect(reindex)
+            self.index_register_row(row)
+            self.edit_cells.append([slave_edit, name_edit, addr_edit, func_combo, bytes_combo])
+
+        for r, widgets in enumerate(self.edit_cells):
+            for c, widget in enumerate(widgets):
+                edited = lambda *_, r=r, c=c: self.cell_edited(r, c)
+                if isinstance(widget, QLineEdit):
+                    widget.textChanged.connect(edited)
+                    # Leave Ctrl+Z/Ctrl+Y to the window's history instead of the editor's own undo
+                    widget.installEventFilter(self)
+                else:
+                    widget.currentIndexChanged.connect(edited)
+
         vbox.addWidget(self.mb_table)
         self.mb_tab.setLayout(vbox)
         self.tabs.addTab(self.mb_tab, "MODBUS REGISTERS")
 
+    @staticmethod
+    def cell_value(widget):
+        return widget.text() if isinstance(widget, QLineEdit) else widget.currentIndex()
+
+    # Cell rows touched by the bulk operations: the config form, or the register table
+    CONFIG_ROWS = range(0, 1)
+    REGISTER_ROWS = range(1, MB_COUNT + 1)
+
+    def read_cells(self, rows=None):
+        """Current cell values, reusing the recorded row tuples that have not changed.
+        Only the given rows are read from the widgets; the rest come from the record."""
+        previous = getattr(self, "edit_values", None)
+        if previous is None:
+            return tuple(tuple(self.cell_value(w) for w in widgets) for widgets in self.edit_cells)
+        current = list(previous)
+        for r in rows if rows is not None else range(len(self.edit_cells)):
+            row = tuple(self.cell_value(w) for w in self.edit_cells[r])
+            if previous[r] != row:
+                current[r] = row
+        return tuple(current)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.ShortcutOverride and (
+                event.matches(QKeySequence.Undo) or event.matches(QKeySequence.Redo)
+                or event.key() == Qt.Key_Y and event.modifiers() == Qt.ControlModifier):
+            return True
+        return super().eventFilter(obj, event)
+
+    def cell_edited(self, r, c):
+        if self.history_muted:
+            return
+        row = self.edit_values[r]
+        new = self.cell_value(self.edit_cells[r][c])
+        if row[c] == new:
+            return
+        self.edit_values[r] = row[:c] + (new,) + row[c + 1:]
+        self.damaged_rows.discard(r - 1)
+        self.history.record_cell(r, c, row[c], new)
+        self.update_undo_actions()
+
+    @contextlib.contextmanager
+    def batched_update(self, rows=None):
+        """Change many cells with signals and repaints held back, then reindex and recheck once"""
+        rows = range(len(self.edit_cells)) if rows is None else rows
+        widgets = [w for r in rows for w in self.edit_cells[r]]
+        registers = [r - 1 for r in rows if r > 0]
+        self.mb_table.setUpdatesEnabled(False)
+        for widget in widgets:
+            widget.blockSignals(True)
+        try:
+            yield
+        finally:
+            for widget in widgets:
+                widget.blockSignals(False)
+            for row in registers:
+                self.index_register_row(row, refilter=False)
+            if registers:
+                self.apply_register_filter()
+            self.mb_table.setUpdatesEnabled(True)
+            self.check_fields_for_data()
+
+    @contextlib.contextmanager
+    def bulk_edit(self, rows=None):
+        """A batched update of the given cell rows (default all), recorded as one undo step"""
+        try:
+            with self.batched_update(rows):
+                yield
+        finally:
+            before = tuple(self.edit_values)
+            after = self.read_cells(rows)
+            if after != before:
+                self.history.record_bulk(before, after)
+                self.edit_values = list(after)
+                self.update_undo_actions()
+
+    @staticmethod
+    def set_cell(widget, value):
+        if isinstance(widget, QLineEdit):
+            widget.setText(value)
+        else:
+            widget.setCurrentIndex(value)
+
+    def revert_register_rows(self):
+        """Put back the recorded register rows over anything a failed, streamed reply showed"""
+        with self.batched_update(self.REGISTER_ROWS):
+            for r in self.REGISTER_ROWS:
+                for widget, value in zip(self.edit_cells[r], self.edit_values[r]):
+                    if self.cell_value(widget) != value:
+                        self.set_cell(widget, value)
+
+    def restore_cells(self, state):
+        changed = [r for r, row in enumerate(state) if row is not self.edit_values[r]]
+        with self.batched_update(changed):
+            for r in changed:
+                current = self.edit_values[r]
+                for c, value in enumerate(state[r]):
+                    if current[c] != value:
+                        self.set_cell(self.edit_cells[r][c], value)
+        self.edit_values = list(state)
+
+    def apply_step(self, step, forward):
+        if len(step) == 2:
+            self.restore_cells(step[1] if forward else step[0])
+            return
+        r, c, old, new = step
+        value = new if forward else old
+        widget = self.edit_cells[r][c]
+        self.history_muted = True
+        try:
+            self.set_cell(widget, value)
+        finally:
+            self.history_muted = False
+        row = self.edit_values[r]
+        self.edit_values[r] = row[:c] + (value,) + row[c + 1:]
+        self.tabs.setCurrentIndex(0 if r == 0 else 1)
+        if r:
+            self.mb_table.scrollTo(self.mb_table.model().index(r - 1, c))
+
+    def undo(self):
+        if self.history.undo_steps:
+            self.apply_step(*self.history.undo())
+            self.update_undo_actions()
+
+    def redo(self):
+        if self.history.redo_steps:
+            self.apply_step(*self.history.redo())
+            self.update_undo_actions()
+
+    def update_undo_actions(self):
+        self.undo_action.setEnabled(bool(self.history.undo_steps))
+        self.redo_action.setEnabled(bool(self.history.redo_steps))
+
+    def index_register_row(self, row, refilter=True):
+        slave = self.mb_table.cellWidget(row, 0)
+        name = self.mb_table.cellWidget(row, 1)
+        addr = self.mb_table.cellWidget(row, 2)
+        func = self.mb_table.cellWidget(row, 3)
+        width = self.mb_table.cellWidget(row, 4)
+        if width is None:
+            return  # row still being built
+        self.mb_index.update(
+            row, name.text().strip(),
+            int(slave.text()) if slave.text().isdigit() else 0,
+            int(addr.text()) if addr.text().isdigit() else None,
+            func.currentIndex() + 1, width.currentIndex() + 1
+        )
+        if refilter and self.mb_filter.text().strip():
+            self.apply_register_filter()
+
+    def apply_register_filter(self):
+        text = self.mb_filter.text().strip()
+        matches = None if text.startswith("#") else self.mb_index.query(text)
+        hidden = set() if matches is None else set(range(MB_COUNT)) - matches
+        # Only touch rows whose visibility changes
+        for row in hidden ^ self.mb_hidden:
+            self.mb_table.setRowHidden(row, row in hidden)
+        self.mb_hidden = hidden
+        self.mb_filter_count.setText("" if matches is None else f"{len(matches)} of {MB_COUNT} rows")
+
+    def jump_to_match(self):
+        text = self.mb_filter.text().strip()
+        if text.startswith("#") and text[1:].isdigit():
+            row = int(text[1:]) - 1
+        else:
+            visible = [r for r in range(MB_COUNT) if r not in self.mb_hidden]
+            vh = self.mb_table.verticalHeader()
+            row = min(visible, key=vh.visualIndex, default=-1)
+        if 0 <= row < MB_COUNT:
+            self.mb_table.scrollTo(self.mb_table.model().index(row, 1))
+            self.mb_table.cellWidget(row, 1).setFocus()
+
+    def sort_registers(self, column):
+        """Reorder rows on screen by moving header sections; the editors and row data stay put"""
+        descending = self.mb_sort == (column, False)
+        self.mb_sort = (column, descending)
+        order = sorted(range(MB_COUNT), key=self.mb_index.sort_key(column), reverse=descending)
+        if descending:
+            # Keep empty rows at the bottom either way
+            order = [r for r in order if self.mb_index.rows[r][0]] + [r for r in order if not self.mb_index.rows[r][0]]
+        vh = self.mb_table.verticalHeader()
+        for visual, row in enumerate(order):
+            vh.moveSection(vh.visualIndex(row), visual)
+
     def function_dropdown(self):
         combo = QComboBox()
-        combo.addItems(["Coils", "Discrete Inputs", "Holding Registers", "Input Registers"])
+        combo.addItems(FUNCTION_NAMES)
         return combo
 
     def bytes_dropdown(self):
@@ -672,67 +2984,262 @@ class USBConfigTool(QWidget):
         return combo
 
     def refresh_ports(self):
-        current = self.port_combo.currentText()
+        current = self.port_combo.currentData()
+        current = current.device if current else None
         self.port_combo.blockSignals(True)
         self.port_combo.clear()
         
         ports = serial.tools.list_ports.comports()
         
         for p in ports:
-            # Check using multiple criteria to identify STM32 CDC ports
-            is_stm32_cdc = (
-                # Check VID/PID pairs (hex or decimal)
-                (hasattr(p, 'vid') and hasattr(p, 'pid') and 
-                 ((p.vid, p.pid) in [(0x0483, 0x5740), (0x0483, 0xDF11), (0x0483, 0x3748)] or
-                  (hex(p.vid)[2:].lower(), hex(p.pid)[2:].lower()) in [('483', '5740'), ('483', 'df11'), ('483', '3748')])) or
-                # Check description
-                (p.description and 
-                 ("STM32" in p.description.upper() and "CDC" in p.description.upper())) or
-                # Check manufacturer
-                (hasattr(p, 'manufacturer') and p.manufacturer and 
-                 "STMicroelectronics" in p.manufacturer)
-            )
-            
-            if is_stm32_cdc:
-                self.port_combo.addItem(p.device, userData=p)  # Store port info in userData
+            if is_stm32_port(p):
+                self.port_combo.addItem(self.prober.label(p), userData=p)  # Store port info in userData
+                if not (self.connected_port and self.connected_port.device == p.device):
+                    self.prober.probe(p)
         
-        if current in [self.port_combo.itemText(i) for i in range(self.port_combo.count())]:
-            self.port_combo.setCurrentText(current)
+        for i in range(self.port_combo.count()):
+            if self.port_combo.itemData(i).device == current:
+                self.port_combo.setCurrentIndex(i)
         self.port_combo.blockSignals(False)
 
-    def toggle_serial(self):
-        if self.serial and self.serial.is_open:
-            self.serial.close()
-            self.serial = None
-            self.timer.stop()
+    def device_identified(self, key, identity):
+        self.prober.remember(key, identity)
+        for i in range(self.port_combo.count()):
+            p = self.port_combo.itemData(i)
+            if port_key(p) == key:
+                self.port_combo.setItemText(i, self.prober.label(p))
+
+    def start_fleet_audit(self):
+        fnames, _ = QFileDialog.getOpenFileNames(
+            self, "Audit Reference (cancel to compare devices with each other)", "",
+            "Configuration Files (*.cfg *.mb);;All Files (*)"
+        )
+        config = registers = None
+        try:
+            for fname in fnames:
+                data = decode_config_file(fname)
+                if "Name" in data:
+                    registers = data
+                else:
+                    config = data
+        except Exception as e:
+            QMessageBox.critical(self, "Load Error", f"Failed to load reference:\n{str(e)}")
+            return
+        self.audit_reference = None
+        if fnames:
+            self.audit_reference = (audit_sections(config, registers), ", ".join(os.path.basename(f) for f in fnames))
+
+        ports = []
+        for i in range(self.port_combo.count()):
+            p = self.port_combo.itemData(i)
+            # The port this window holds open cannot be queried a second time
+            if not is_dfu_port(p) and not (self.connected_port and self.connected_port.device == p.device):
+                ports.append((p.device, self.port_combo.itemText(i)[len(p.device):].strip()))
+        if not ports:
+            QMessageBox.information(self, "Fleet Audit", "No devices available to audit (disconnect to include this one).")
+            return
+        self.status_label.setText(f"AUDITING {len(ports)}...")
+        # Identify probes also open the ports: let those running finish and start no more until done
+        self.prober.pause()
+        self.auditor.start(ports, ready=lambda: self.prober.wait_idle(device for device, _ in ports))
+
+    def show_audit_report(self, results):
+        self.prober.resume()
+        self.status_label.setText("● CONNECTED" if self.serial else "○ DISCONNECTED")
+        self.audit_results = results
+        reference, name = self.audit_reference or (None, None)
+        report = audit_report(results, reference, name)
+        if self.connected_port:
+            report += f"\n{self.connected_port.device} was skipped because it is connected."
+
+        dialog = QMessageBox(self)
+        dialog.setWindowTitle("Fleet Audit")
+        dialog.setText(report.splitlines()[-1])
+        dialog.setDetailedText(report)
+        save_btn = dialog.addButton("Save Report", QMessageBox.ActionRole)
+        dialog.addButton(QMessageBox.Close)
+        dialog.exec_()
+        if dialog.clickedButton() == save_btn:
+            fname, _ = QFileDialog.getSaveFileName(self, "Save Audit Report", "", "Text Files (*.txt)")
+            if fname:
+                with open(fname, "w") as f:
+                    f.write(report)
+
+    def show_connected(self, connected, status="● CONNECTED"):
+        if connected:
+            self.status_label.setText(status)
+            self.status_label.setStyleSheet("color: green; font-weight: bold")
+            self.connect_btn.setText("DISCONNECT")
+            self.tabs.setEnabled(True)
+            self.set_active_tab_style()
+        else:
             self.status_label.setText("○ DISCONNECTED")
             self.status_label.setStyleSheet("color: red; font-weight: bold")
             self.connect_btn.setText("CONNECT")
             self.tabs.setEnabled(False)
             self.set_inactive_tab_style()
-            
-            # Hide action buttons when disconnected
-            self.read_btn.setVisible(False)
-            self.write_btn.setVisible(False)
-            self.reset_btn.setVisible(False)
-            self.save_btn.setVisible(False)
-            self.load_btn.setVisible(False)
+        
+        # Action buttons are only shown while connected
+        self.read_btn.setVisible(connected)
+        self.write_btn.setVisible(connected)
+        self.verify_btn.setVisible(connected)
+        self.reset_btn.setVisible(connected)
+        self.save_btn.setVisible(connected)
+        self.load_btn.setVisible(connected)
+
+    def show_mqtt_estimate(self):
+        """Publish size and rate for the configuration on screen, plus the devices of the last fleet audit"""
+        try:
+            config = self.collect_config()
+            registers = self.collect_registers()
+        except ValueError as e:
+            QMessageBox.critical(self, "Error", str(e))
+            return
+        estimates = [("this configuration", estimate_mqtt(config, registers))]
+        for r in self.audit_results:
+            sections = r.get("sections", {})
+            if "device" in sections and "registers" in sections:
+                device_config = dict(sections["device"][1], **sections.get("mqtt", (None, {}))[1])
+                estimates.append((r["port"], estimate_mqtt(device_config, RegisterMap.from_json(sections["registers"][1]))))
+        report = mqtt_estimate_report(estimates)
+
+        dialog = QMessageBox(self)
+        dialog.setWindowTitle("MQTT Load Estimate")
+        dialog.setText("Estimated MQTT load (run a Fleet Audit first to include attached devices).")
+        dialog.setDetailedText(report)
+        measure_btn = dialog.addButton("Measure with Local Broker", QMessageBox.ActionRole)
+        dialog.addButton(QMessageBox.Close)
+        dialog.exec_()
+        if dialog.clickedButton() == measure_btn:
+            self.measure_mqtt(config, registers, estimates[0][1])
+
+    def measure_mqtt(self, config, registers, estimate, count=5, speedup=100):
+        # Publish through the stand-in broker as a simulated device; the result arrives in show_mqtt_measurement
+        self.mqtt_estimate = estimate
+        self.mqtt_measurer.start(config.get("PubTopic") or "test", lambda: simulated_reading(config, registers),
+                                 estimate["interval"], count, speedup)
+
+    def show_mqtt_measurement(self, result):
+        measured, topic, estimate = result["measured"], result["topic"], self.mqtt_estimate
+        if not measured:
+            QMessageBox.warning(self, "MQTT Measurement",
+                                f"The broker stand-in received nothing.{' ' + result['error'] if result['error'] else ''}")
+            return
+        rate = measured["messages_per_s"] / result["speedup"]
+        QMessageBox.information(
+            self, "MQTT Measurement",
+            f"Framing and rate check: a simulated device publishing random register values.\n\n"
+            f"{measured['messages']} messages received on '{topic}'\n"
+            f"Packet size: {measured['packet_bytes']:.0f} B average "
+            f"(estimated {estimate['packet_min']}-{estimate['packet_max']} B)\n"
+            f"Payload size: {measured['payload_bytes']:.0f} B average\n"
+            f"Rate: {rate:.3g} msg/s, {rate * measured['packet_bytes']:.3g} B/s "
+            f"(estimated at most {estimate['bytes_per_s']:.3g} B/s)\n\n"
+            f"For what real devices send, run the application with --standin mqtt and point them at this host."
+        )
+
+    def upload_firmware(self):
+        fname, _ = QFileDialog.getOpenFileName(self, "Upload Firmware", "", "Firmware Images (*.bin);;All Files (*)")
+        if not fname:
+            return
+        with open(fname, "rb") as f:
+            image = f.read()
+
+        targets = []
+        for i in range(self.port_combo.count()):
+            p = self.port_combo.itemData(i)
+            if is_flash_target(p, self.prober.cache.get(port_key(p))):
+                targets.append((self.port_combo.itemText(i), "cdc", p.device))
+        for dev in dfu_devices():
+            targets.append((f"DFU {dev.bus}:{dev.address}", "dfu", dev))
+        if not targets:
+            QMessageBox.information(self, "Upload Firmware", "No devices that can take firmware are attached.")
+            return
+        targets = self.choose_flash_targets(targets, f"{os.path.basename(fname)} ({len(image)} bytes)")
+        if not targets:
+            return
+        # The uploader needs the ports to itself
+        if (self.serial and self.serial.is_open) or self.reconnecting:
+            self.toggle_serial()
+        self.port_refresh.stop()
+        self.prober.pause()
+        self.flash_progress = {name: 0 for name, _, _ in targets}
+        # Cached identities of everything being flashed go stale (Version), flashed or not;
+        # a DFU device comes back as a CDC port, so its DFU entry goes too
+        devices = {target for _, kind, target in targets if kind == "cdc"}
+        self.flashed_keys = [port_key(p) for p in (self.port_combo.itemData(i) for i in range(self.port_combo.count()))
+                             if p.device in devices or is_dfu_port(p)]
+        self.status_label.setText("FLASHING 0%")
+        devices = [target for _, kind, target in targets if kind == "cdc"]
+        self.flasher.start(image, targets, ready=lambda: self.prober.wait_idle(devices))
+
+    def choose_flash_targets(self, targets, image_name):
+        """Let the operator tick the devices to flash; returns the chosen targets ([] on cancel)"""
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Upload Firmware")
+        layout = QVBoxLayout(dialog)
+        layout.addWidget(QLabel(f"Flash {image_name} to:"))
+        device_list = QListWidget()
+        for name, _, _ in targets:
+            item = QListWidgetItem(name)
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Checked)
+            device_list.addItem(item)
+        layout.addWidget(device_list)
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.button(QDialogButtonBox.Ok).setText("Flash")
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        layout.addWidget(buttons)
+        if dialog.exec_() != QDialog.Accepted:
+            return []
+        return [t for i, t in enumerate(targets) if device_list.item(i).checkState() == Qt.Checked]
+
+    def show_flash_progress(self, name, done, total):
+        self.flash_progress[name] = done / total
+        percent = int(100 * sum(self.flash_progress.values()) / len(self.flash_progress))
+        self.status_label.setText(f"FLASHING {percent}%")
+
+    def show_flash_results(self, results):
+        self.prober.resume()
+        for key in self.flashed_keys:
+            self.prober.forget(key)
+        self.flashed_keys = []
+        self.refresh_ports()
+        self.port_refresh.start(2000)
+        self.show_connected(False)
+        QMessageBox.information(
+            self, "Upload Firmware",
+            "\n".join(f"{name}: {result}" for name, result in results)
+        )
+
+    def toggle_serial(self):
+        if (self.serial and self.serial.is_open) or self.reconnecting:
+            if self.serial:
+                self.serial.close()
+            self.serial = None
+            self.connected_port = None
+            self.timer.stop()
+            self.reconnect_timer.stop()
+            self.reconnecting = False
+            self.outbox.clear()
+            self.requests.clear()
+            self.reset_stream()
+            self.show_connected(False)
         else:
             try:
-                self.serial = serial.Serial(self.port_combo.currentText(), 115200, timeout=0.1)
+                port_info = self.port_combo.currentData()
+                if port_info is None:
+                    raise Exception("No device selected")
+                # A probe identifying this device has it open; let it finish first
+                if not self.prober.wait_idle([port_info.device]):
+                    raise Exception(f"{port_info.device} is busy, try again")
+                self.serial = serial.Serial(port_info.device, 115200, timeout=0.1)
+                if self.recorder:
+                    self.serial = RecordingSerial(self.serial, self.recorder)
+                self.connected_port = port_info
                 self.timer.start(100)
-                self.status_label.setText("● CONNECTED")
-                self.status_label.setStyleSheet("color: green; font-weight: bold")
-                self.connect_btn.setText("DISCONNECT")
-                self.tabs.setEnabled(True)
-                self.set_active_tab_style()
-                
-                # Show action buttons when connected
-                self.read_btn.setVisible(True)
-                self.write_btn.setVisible(True)
-                self.reset_btn.setVisible(True)
-                self.save_btn.setVisible(True)
-                self.load_btn.setVisible(True)
+                self.show_connected(True)
                 
                 # Check initial state
                 self.check_fields_for_data()
@@ -741,19 +3248,33 @@ class USBConfigTool(QWidget):
                 QMessageBox.critical(self, "Error", str(e))
                 self.tabs.setEnabled(False)
 
+    def choose_replay(self):
+        fname, _ = QFileDialog.getOpenFileName(self, "Replay Recording", "", "Serial Recordings (*.iotraw);;All Files (*)")
+        if fname:
+            self.start_replay(fname)
+
+    def start_replay(self, fname, speed=1.0):
+        """Drive the GUI from a recording instead of a device; DISCONNECT ends the replay"""
+        try:
+            log = TrafficLog(fname)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "Replay Error", str(e))
+            return
+        if self.serial and self.serial.is_open:
+            self.toggle_serial()
+        self.reset_stream()
+        self.serial = ReplaySerial(log, speed)
+        self.timer.start(100)
+        self.show_connected(True, "▶ REPLAY")
+        self.check_fields_for_data()
+
     def check_fields_for_data(self):
         """Enable write/save buttons only if there's data in any field"""
         current_tab = self.tabs.currentIndex()
         has_data = False
         
         if current_tab == 0:  # Device Config tab
-            for widget in self.fields.values():
-                if isinstance(widget, QLineEdit) and widget.text().strip():
-                    has_data = True
-                    break
-                elif isinstance(widget, QComboBox) and widget.currentIndex() > 0:
-                    has_data = True
-                    break
+            has_data = any(check() for check in self.field_checks)
         else:  # Modbus tab
             for row in range(MB_COUNT):
                 if (self.mb_table.cellWidget(row, 1).text().strip() or  # Name
@@ -764,12 +3285,98 @@ class USBConfigTool(QWidget):
         self.write_btn.setEnabled(has_data)
         self.save_btn.setEnabled(has_data)
 
+    def send_command(self, cmd, callback=None, timeout=None, on_timeout=None):
+        """Send one command line. With a callback the reply is routed to it by sequence ID."""
+        if callback:
+            cmd["Seq"] = self.requests.register(cmd["DataType"], callback, timeout, on_timeout)
+        line = (json.dumps(cmd) + "\n").encode()
+        if callback:
+            self.requests.sent(cmd["Seq"], line)
+        self.outbox.append([line, 0])
+        if not self.reconnecting:
+            self.flush_outbox()
+
+    def flush_outbox(self):
+        # Commands leave in COMMAND_CHUNK pieces; progress is kept so a dropped link can pick up from here
+        try:
+            while self.outbox:
+                entry = self.outbox[0]
+                line, pos = entry
+                while pos < len(line):
+                    self.serial.write(line[pos:pos + COMMAND_CHUNK])
+                    pos = entry[1] = min(pos + COMMAND_CHUNK, len(line))
+                self.outbox.popleft()
+        except (serial.SerialException, OSError):
+            self.connection_lost()
+
+    def connection_lost(self):
+        if self.reconnecting:
+            return
+        self.reconnecting = True
+        self.timer.stop()
+        try:
+            self.serial.close()
+        except Exception:
+            pass
+        self.serial = None
+        # The rest of a reply that was arriving is lost; a resumed request is answered from the start
+        self.reset_stream()
+        self.status_label.setText("◌ RECONNECTING")
+        self.status_label.setStyleSheet("color: orange; font-weight: bold")
+        self.reconnect_delay = 0.05
+        self.reconnect_timer.start(int(self.reconnect_delay * 1000))
+
+    def attempt_reconnect(self):
+        """Find the same device again by USB serial number, wherever it re-enumerated, and reopen it"""
+        key = port_key(self.connected_port)
+        for p in serial.tools.list_ports.comports():
+            if is_stm32_port(p) and port_key(p) == key:
+                try:
+                    ser = serial.Serial(p.device, 115200, timeout=0.1)
+                except (serial.SerialException, OSError):
+                    break
+                self.serial = RecordingSerial(ser, self.recorder) if self.recorder else ser
+                self.connected_port = p
+                self.reconnecting = False
+                self.resume_transfers()
+                if self.reconnecting:
+                    return
+                self.timer.start(100)
+                self.show_connected(True)
+                self.refresh_ports()
+                return
+        # Back off: 50 ms, 100 ms, 200 ms ... up to 5 s between attempts
+        self.reconnect_delay = min(self.reconnect_delay * 2, 5.0)
+        self.reconnect_timer.start(int(self.reconnect_delay * 1000))
+
+    def resume_transfers(self):
+        # The device may have reset and dropped a partially received line, and the protocol has
+        # no per-chunk acknowledgements. A bare newline makes it discard any partial line; then
+        # the interrupted command is resent whole. Commands that were written completely are
+        # not sent again, except requests still waiting for a reply.
+        queued = [entry[0] for entry in self.outbox]
+        retries = [line for line in self.requests.restart() if not any(line is q for q in queued)]
+        self.outbox = collections.deque([[b"\n", 0]] + [[line, 0] for line in retries + queued])
+        self.flush_outbox()
+
+    def request_timed_out(self, data_type):
+        self.status_label.setText("● NO REPLY")
+        self.status_label.setStyleSheet("color: orange; font-weight: bold")
+
     def read_current_tab(self):
         if not self.serial or not self.serial.is_open:
             return
-        tab = self.tabs.currentIndex()
-        cmd = {"DataType": 1} if tab == 0 else {"DataType": 3}
-        self.serial.write((json.dumps(cmd) + "\n").encode())
+        if self.tabs.currentIndex() == 0:
+            self.send_command({"DataType": 1}, self.update_fields, on_timeout=self.request_timed_out)
+        else:
+            self.send_command({"DataType": 3}, self.load_modbus_table, on_timeout=self.request_timed_out)
+
+    def read_all(self):
+        """Pipeline the device config and Modbus map requests without waiting in between"""
+        if not self.serial or not self.serial.is_open:
+            return
+        self.send_command({"DataType": 1}, self.update_fields, on_timeout=self.request_timed_out)
+        self.send_command({"DataType": 3}, self.load_modbus_table, on_timeout=self.request_timed_out)
 
     def write_current_tab(self):
         if not self.serial or not self.serial.is_open:
@@ -777,164 +3384,272 @@ class USBConfigTool(QWidget):
         if self.tabs.currentIndex() == 0:
             self.send_config_json()
         else:
+            if self.damaged_rows:
+                reply = QMessageBox.question(
+                    self, "Write",
+                    f"{len(self.damaged_rows)} row(s) were damaged in the last read and are empty. "
+                    "Writing now removes those registers from the device. Write anyway?",
+                    QMessageBox.Yes | QMessageBox.No
+                )
+                if reply == QMessageBox.No:
+                    return
             self.send_modbus_json()
 
+    def verify_current_tab(self):
+        """Confirm the last WRITE landed by comparing checksums, falling back to a full read"""
+        if not self.serial or not self.serial.is_open:
+            return
+        section = 1 if self.tabs.currentIndex() == 0 else 3
+        expected = self.last_sent.get((self.sent_key(), section))
+        if expected is None:
+            try:
+                expected = self.collect_config() if section == 1 else self.collect_modbus()
+            except ValueError as e:
+                QMessageBox.critical(self, "Error", str(e))
+                return
+        crc = config_checksum(expected)
+        self.send_command(
+            {"DataType": 5, "Section": section},
+            lambda reply: self.checksum_received(section, expected, crc, reply),
+            timeout=1.0,
+            on_timeout=lambda _: self.verify_by_read(section, expected)
+        )
+
+    def checksum_received(self, section, expected, crc, reply):
+        if reply.get("CRC") == crc:
+            self.show_verify_result([], f"CRC 0x{crc:08X}")
+        else:
+            self.verify_by_read(section, expected)
+
+    def verify_by_read(self, section, expected):
+        # Device has no checksum support or disagrees: fetch the section and compare structurally
+        self.send_command(
+            {"DataType": section},
+            lambda reply: self.show_verify_result(
+                config_differences(expected, normalize_device_reply(expected, reply)), "full read-back"),
+            on_timeout=self.request_timed_out
+        )
+
+    def show_verify_result(self, diffs, method):
+        if not diffs:
+            QMessageBox.information(self, "Verify", f"Device configuration matches ({method}).")
+            return
+        shown = "\n".join(diffs[:20])
+        if len(diffs) > 20:
+            shown += f"\n... and {len(diffs) - 20} more"
+        QMessageBox.warning(self, "Verify", f"Device configuration differs ({method}):\n\n{shown}")
+
     def read_from_serial(self):
-        if self.serial and self.serial.in_waiting:
+        self.requests.expire()
+        try:
+            # One read per tick, so a fast replay cannot hold the GUI thread
+            if self.serial and self.serial.in_waiting:
+                events = self.decoder.feed(self.serial.read(self.serial.in_waiting))
+            else:
+                events = []
+        except (serial.SerialException, OSError):
+            self.connection_lost()
+            return
+        for event in events:
+            if event[0] == "item":
+                self.stream_register(*event[1:])
+                continue
+            streamed = event[1] is self.streaming_rows
+            self.streaming_rows = None
             try:
-                line = self.serial.readline().decode(errors='ignore').strip()
-                if not line: 
-                    return
-                    
-                if line.startswith("{") and line.endswith("}"):
-                    try:
-                        data = json.loads(line)
-                        if data.get("DataType") == 3:
-                            self.load_modbus_table(data)
-                        else:
-                            self.update_fields(data)
-                    except json.JSONDecodeError:
-                        pass
+                self.dispatch_reply(event[1], event[2])
             except Exception as e:
-                pass
+                # A failing handler must not take the rest of the batch with it, nor fail silently
+                traceback.print_exc()
+                if streamed:
+                    self.revert_register_rows()
+                QMessageBox.warning(self, "Device Reply", f"Failed to apply a device reply:\n{e}")
+
+    def reset_stream(self):
+        """Forget a reply that was partly received, and any register rows it had shown"""
+        self.decoder.reset()
+        if self.streaming_rows is not None:
+            self.streaming_rows = None
+            self.revert_register_rows()
+
+    def dispatch_reply(self, data, errors=0):
+        if "Name" in data or data.get("DataType") == 3:
+            # Bytes may be absent on older firmware, but not because the reply was cut short
+            missing = [k for k in REGISTER_KEYS if not isinstance(data.get(k), list) and (k != "Bytes" or errors)]
+            if missing:
+                self.reject_reply(data, f"The register map from the device is incomplete "
+                                        f"(missing {', '.join(missing)}) and was not applied.")
+                return
+            if self.requests.callback_for(data) not in (None, self.load_modbus_table):
+                data = drop_damaged_registers(data)
+        elif errors:
+            self.reject_reply(data, f"A reply from the device was damaged in transit ({errors} error(s)) "
+                                    "and was not applied. Please read again.")
+            return
+        if self.requests.resolve(data):
+            return
+        if data.get("DataType") == 3 or "Name" in data:
+            self.load_modbus_table(data)
+        else:
+            self.update_fields(data)
+
+    def reject_reply(self, data, message):
+        self.requests.discard(data)
+        if "Name" in data:
+            self.revert_register_rows()
+        QMessageBox.warning(self, "Device Reply", message)
+
+    def stream_register(self, key, index, value, partial):
+        """Show register cells while a large map is still arriving; the complete reply is loaded at the end"""
+        if partial is not self.streaming_rows:
+            # Only stream into the table if the reply is going there anyway (not e.g. a VERIFY read)
+            callback = self.requests.callback_for(partial, 3)
+            if callback is not None and callback != self.load_modbus_table:
+                return
+            self.streaming_rows = partial
+        if value is None or index >= MB_COUNT or key not in REGISTER_KEYS:
+            return
+        # Not recorded here; the complete reply is loaded as one undo step
+        self.history_muted = True
+        try:
+            if key == "Name":
+                self.mb_table.cellWidget(index, 1).setText(RegisterMap.encode_name(str(value)).decode())
+            elif key == "SlaveID":
+                self.mb_table.cellWidget(index, 0).setText(str(int(value)))
+            elif key == "Address":
+                self.mb_table.cellWidget(index, 2).setText(str(int(value)))
+            elif key == "Function":
+                self.mb_table.cellWidget(index, 3).setCurrentIndex(int(value) - 1)
+            else:
+                self.mb_table.cellWidget(index, 4).setCurrentIndex(max(0, min(3, int(value) - 1)))
+        except (TypeError, ValueError):
+            pass
+        finally:
+            self.history_muted = False
 
     def update_fields(self, data):
-        for key, widget in self.fields.items():
-            if key not in data:
-                continue
-            val = data[key]
-            if isinstance(widget, QLineEdit):
-                widget.setText(str(val))
-            elif isinstance(widget, QComboBox):
-                if key == "StopBit":
-                    val = "1" if int(val) == 0 else "2"
-                elif key == "Parity":
-                    val = {0: "None", 1536: "Odd", 1024: "Even"}.get(int(val), "None")
-                idx = widget.findText(str(val))
-                if idx >= 0:
-                    widget.setCurrentIndex(idx)
-        
-        # After updating fields, check if we should enable write/save
-        self.check_fields_for_data()
+        if self.connected_port and ("SiteName" in data or "PanelName" in data):
+            self.prober.remember(port_key(self.connected_port),
+                                 {k: data[k] for k in ("SiteName", "PanelName") if k in data})
+        # One undo step; bulk_edit also rechecks write/save
+        with self.bulk_edit(self.CONFIG_ROWS):
+            for key, write in self.field_writers.items():
+                if key in data:
+                    write(data[key])
 
     def clear_gui_fields(self):
         current_tab = self.tabs.currentIndex()
         
-        if current_tab == 0:
-            for w in self.fields.values():
-                if isinstance(w, QLineEdit):
-                    w.clear()
-                elif isinstance(w, QComboBox):
-                    w.setCurrentIndex(0)
-        elif current_tab == 1:
-            for row in range(MB_COUNT):
-                self.mb_table.cellWidget(row, 0).setText("0")
-                self.mb_table.cellWidget(row, 1).setText("")
-                self.mb_table.cellWidget(row, 2).setText("")
-                self.mb_table.cellWidget(row, 3).setCurrentIndex(0)
-                self.mb_table.cellWidget(row, 4).setCurrentIndex(0)
+        with self.bulk_edit(self.CONFIG_ROWS if current_tab == 0 else self.REGISTER_ROWS):
+            if current_tab == 0:
+                for clear in self.field_clearers:
+                    clear()
+            elif current_tab == 1:
+                self.clear_register_rows()
+                self.damaged_rows = set()
         
         # After clearing, disable write/save buttons
         self.write_btn.setEnabled(False)
         self.save_btn.setEnabled(False)
 
-    def load_modbus_table(self, data):
+    def clear_register_rows(self):
         for row in range(MB_COUNT):
             self.mb_table.cellWidget(row, 0).setText("0")
             self.mb_table.cellWidget(row, 1).setText("")
             self.mb_table.cellWidget(row, 2).setText("")
             self.mb_table.cellWidget(row, 3).setCurrentIndex(0)
             self.mb_table.cellWidget(row, 4).setCurrentIndex(0)
-        
-        count = min(len(data.get("Name", [])), MB_COUNT)
-        for i in range(count):
-            self.mb_table.cellWidget(i, 0).setText(str(data["SlaveID"][i]))
-            self.mb_table.cellWidget(i, 1).setText(data["Name"][i][:11])
-            self.mb_table.cellWidget(i, 2).setText(str(data["Address"][i]))
-            self.mb_table.cellWidget(i, 3).setCurrentIndex(int(data["Function"][i])-1)
-            
-            # Handle byte selection (1-4)
-            bytes_val = data["Bytes"][i] if i < len(data.get("Bytes", [])) else 1
-            byte_index = max(0, min(3, bytes_val - 1))  # Ensure it's between 0-3 (for 1-4 bytes)
-            self.mb_table.cellWidget(i, 4).setCurrentIndex(byte_index)
-        
-        # After loading data, check if we should enable write/save
-        self.check_fields_for_data()
 
-    def send_config_json(self):
-        config = {"DataType": 2}
-        for key, widget in self.fields.items():
-            if isinstance(widget, QLineEdit):
-                config[key] = widget.text()
-            elif isinstance(widget, QComboBox):
-                if key == "StopBit":
-                    config[key] = 0 if widget.currentText() == "1" else 8192
-                elif key == "Parity":
-                    config[key] = {"None": 0, "Odd": 1536, "Even": 1024}.get(widget.currentText(), 0)
-                else:
-                    config[key] = int(widget.currentText())
-        try:
-            config["Interval"] = int(self.fields["Interval"].text())
-        except:
-            QMessageBox.critical(self, "Error", "Invalid Interval value")
-            return
-        json_str = json.dumps(config)
-        for i in range(0, len(json_str), 64):
-            self.serial.write(json_str[i:i+64].encode())
-        self.serial.write(b"\n")
+    def load_modbus_table(self, data):
+        damaged = []
+        if not isinstance(data, RegisterMap):
+            damaged = [i for i in damaged_register_rows(data) if i < MB_COUNT]
+            try:
+                data = RegisterMap.from_json(drop_damaged_registers(data))
+            except ValueError:
+                self.revert_register_rows()
+                raise
+        regs = data
+        names = regs.name_list()
+        # Damaged rows stay empty in their place, so the rows after them keep their positions
+        rows = [i for i in range(MB_COUNT) if i not in set(damaged)]
+        # One undo step; bulk_edit also rechecks write/save
+        with self.bulk_edit(self.REGISTER_ROWS):
+            self.clear_register_rows()
+            for j, i in zip(range(len(regs)), rows):
+                self.mb_table.cellWidget(i, 0).setText(str(regs.slave_ids[j]))
+                self.mb_table.cellWidget(i, 1).setText(names[j])
+                self.mb_table.cellWidget(i, 2).setText(str(regs.addresses[j]))
+                self.mb_table.cellWidget(i, 3).setCurrentIndex(regs.functions[j] - 1)
+                self.mb_table.cellWidget(i, 4).setCurrentIndex(regs.widths[j] - 1)
+        self.damaged_rows = set(damaged)
+        if damaged:
+            QMessageBox.warning(
+                self, "Device Reply",
+                f"{len(damaged)} register row(s) were damaged in transit and left empty "
+                f"(rows {', '.join(str(i + 1) for i in damaged[:20])}{', ...' if len(damaged) > 20 else ''}).\n"
+                "Read again before writing, or the device will lose those registers."
+            )
 
-    def send_modbus_json(self):
-        data = {"DataType": 4, "Name": [], "Address": [], "Function": [], "SlaveID": [], "Bytes": []}
+    def collect_config(self):
+        """Device config in wire form, shared by WRITE, SAVE and VERIFY"""
+        return {key: read() for key, read in self.field_readers}
+
+    def collect_registers(self):
+        """Register map from the table (rows without a name are skipped)"""
+        regs = RegisterMap()
         for row in range(MB_COUNT):
-            slave_edit = self.mb_table.cellWidget(row, 0)
-            name_edit = self.mb_table.cellWidget(row, 1)
-            addr_edit = self.mb_table.cellWidget(row, 2)
-            
-            name = name_edit.text().strip()
+            name = self.mb_table.cellWidget(row, 1).text().strip()
             if not name:
                 continue
-
             try:
-                data["SlaveID"].append(int(slave_edit.text()))
-                data["Name"].append(name)
-                data["Address"].append(int(addr_edit.text()))
-                data["Function"].append(
-                    ["Coils", "Discrete Inputs", "Holding Registers", "Input Registers"].index(
-                        self.mb_table.cellWidget(row, 3).currentText()
-                    ) + 1
+                regs.append(
+                    int(self.mb_table.cellWidget(row, 0).text()),
+                    name,
+                    int(self.mb_table.cellWidget(row, 2).text()),
+                    self.mb_table.cellWidget(row, 3).currentIndex() + 1,
+                    self.mb_table.cellWidget(row, 4).currentIndex() + 1
                 )
-                # Handle 1-4 bytes selection
-                byte_selection = int(self.mb_table.cellWidget(row, 4).currentText())
-                if byte_selection < 1 or byte_selection > 4:
-                    raise ValueError("Bytes must be between 1 and 4")
-                data["Bytes"].append(byte_selection)
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Row {row+1}: {str(e)}")
-                return
+            except ValueError as e:
+                raise ValueError(f"Row {row+1}: {str(e)}")
+        return regs
+
+    def collect_modbus(self):
+        """Register map in wire form, shared by WRITE, SAVE and VERIFY"""
+        return self.collect_registers().to_json()
+
+    def sent_key(self):
+        # Writes are remembered per device, so VERIFY never checks one board against another's write
+        return port_key(self.connected_port) if self.connected_port else None
+
+    def send_config_json(self):
+        try:
+            config = self.collect_config()
+        except ValueError as e:
+            QMessageBox.critical(self, "Error", str(e))
+            return
+        self.last_sent[(self.sent_key(), 1)] = config
+        if self.connected_port:
+            self.prober.remember(port_key(self.connected_port),
+                                 {"SiteName": config["SiteName"], "PanelName": config["PanelName"]})
+        self.send_command(dict({"DataType": 2}, **config))
 
-        json_str = json.dumps(data)
-        for i in range(0, len(json_str), 64):
-            self.serial.write(json_str[i:i+64].encode())
-        self.serial.write(b"\n")
+    def send_modbus_json(self):
+        try:
+            data = self.collect_modbus()
+        except ValueError as e:
+            QMessageBox.critical(self, "Error", str(e))
+            return
+        self.last_sent[(self.sent_key(), 3)] = data
+        self.send_command(dict({"DataType": 4}, **data))
 
     def save_config(self):
         tab = self.tabs.currentIndex()
-        data = {}
         if tab == 0:
-            for key, widget in self.fields.items():
-                if isinstance(widget, QLineEdit):
-                    data[key] = widget.text()
-                elif isinstance(widget, QComboBox):
-                    if key == "StopBit":
-                        data[key] = 0 if widget.currentText() == "1" else 8192
-                    elif key == "Parity":
-                        data[key] = {"None": 0, "Odd": 1536, "Even": 1024}.get(widget.currentText(), 0)
-                    else:
-                        data[key] = int(widget.currentText())
             try:
-                data["Interval"] = int(self.fields["Interval"].text())
-            except:
-                QMessageBox.critical(self, "Error", "Invalid Interval value")
+                data = self.collect_config()
+            except ValueError as e:
+                QMessageBox.critical(self, "Error", str(e))
                 return
             
             fname, _ = QFileDialog.getSaveFileName(
@@ -942,29 +3657,11 @@ class USBConfigTool(QWidget):
                 "Device Config Files (*.cfg)"
             )
         else:
-            data = {"Name": [], "Address": [], "Function": [], "SlaveID": [], "Bytes": []}
-            for row in range(MB_COUNT):
-                name_edit = self.mb_table.cellWidget(row, 1)
-                name = name_edit.text().strip()
-                if not name:
-                    continue
-                try:
-                    data["Name"].append(name)
-                    data["Address"].append(int(self.mb_table.cellWidget(row, 2).text()))
-                    data["SlaveID"].append(int(self.mb_table.cellWidget(row, 0).text()))
-                    data["Function"].append(
-                        ["Coils", "Discrete Inputs", "Holding Registers", "Input Registers"].index(
-                            self.mb_table.cellWidget(row, 3).currentText()
-                        ) + 1
-                    )
-                    # Save the byte selection (1-4)
-                    byte_selection = int(self.mb_table.cellWidget(row, 4).currentText())
-                    if byte_selection < 1 or byte_selection > 4:
-                        raise ValueError("Bytes must be between 1 and 4")
-                    data["Bytes"].append(byte_selection)
-                except Exception as e:
-                    QMessageBox.critical(self, "Error", f"Invalid data in row {row+1}: {str(e)}")
-                    return
+            try:
+                data = self.collect_modbus()
+            except ValueError as e:
+                QMessageBox.critical(self, "Error", str(e))
+                return
             
             fname, _ = QFileDialog.getSaveFileName(
                 self, "Save Modbus Settings", "", 
@@ -980,20 +3677,7 @@ class USBConfigTool(QWidget):
             fname += '.mb'
             
         try:
-            json_data = json.dumps(data).encode()
-            
-            if CRYPTO_AVAILABLE:
-                try:
-                    fernet = Fernet(ENCRYPTION_KEY)
-                    encrypted = fernet.encrypt(json_data)
-                    encoded = base64.b64encode(encrypted).decode()
-                except:
-                    encoded = base64.b64encode(json_data).decode()
-            else:
-                encoded = base64.b64encode(json_data).decode()
-                
-            with open(fname, "w") as f:
-                f.write(encoded)
+            encode_config_file(fname, data)
             QMessageBox.information(self, "Success", f"Configuration saved to {fname}")
             
         except Exception as e:
@@ -1015,30 +3699,7 @@ class USBConfigTool(QWidget):
             return
             
         try:
-            with open(fname, "r") as f:
-                encoded = f.read().strip()
-                
-            try:
-                decoded = base64.b64decode(encoded)
-            except:
-                with open(fname, "r") as f:
-                    config = json.load(f)
-                if tab == 0:
-                    self.update_fields(config)
-                else:
-                    self.load_modbus_table(config)
-                return
-                
-            if CRYPTO_AVAILABLE:
-                try:
-                    fernet = Fernet(ENCRYPTION_KEY)
-                    decrypted = fernet.decrypt(decoded)
-                    config = json.loads(decrypted.decode())
-                except:
-                    config = json.loads(decoded.decode())
-            else:
-                config = json.loads(decoded.decode())
-                
+            config = decode_config_file(fname)
             if tab == 0:
                 self.update_fields(config)
             else:
@@ -1048,7 +3709,123 @@ class USBConfigTool(QWidget):
             QMessageBox.critical(self, "Load Error", f"Failed to load configuration:\n{str(e)}")
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description="Configuration tool for IoT devices")
+    parser.add_argument("--profile", nargs="?", const="iot-configurator-trace.json", metavar="TRACE_JSON",
+                        help="time the UI hot paths and write a Chrome trace / Perfetto JSON file on exit")
+    parser.add_argument("--cprofile", metavar="PSTATS",
+                        help="with --profile, also write a cProfile dump to this file")
+    parser.add_argument("--record", metavar="IOTRAW",
+                        help="record all serial traffic to this binary log file")
+    parser.add_argument("--replay", metavar="IOTRAW",
+                        help="drive the GUI from a recorded log instead of a device")
+    parser.add_argument("--replay-to", metavar="PORT",
+                        help="with --replay, send the recorded commands to this serial port (a device or a "
+                             "stand-in's pseudo-terminal) instead of opening the GUI")
+    parser.add_argument("--replay-speed", type=float, default=1.0, metavar="FACTOR",
+                        help="replay speed-up factor (0 = as fast as possible)")
+    parser.add_argument("--standin", choices=["bootloader", "mqtt", "update"],
+                        help="run a stand-in (bootloader PTY, MQTT broker or release server) for testing, without the GUI")
+    parser.add_argument("--nak-every", type=int, default=0, metavar="N",
+                        help="with --standin bootloader, reject the first transmission of every N-th block")
+    parser.add_argument("--standin-dir", default=".", metavar="DIR",
+                        help="release directory served by --standin update")
+    parser.add_argument("--daemon", nargs="?", const="127.0.0.1:8765", metavar="HOST:PORT",
+                        help="run the local HTTP/JSON automation service instead of the GUI")
+    parser.add_argument("--benchmark", nargs="?", const=BENCHMARK_BASELINE, metavar="BASELINE_JSON",
+                        help="time the UI hot paths offscreen and compare them with a stored baseline")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="with --benchmark, store this run as the new baseline")
+    parser.add_argument("--threshold", type=float, default=25.0, metavar="PERCENT",
+                        help="with --benchmark, how much worse than the baseline counts as a regression")
+    args, qt_args = parser.parse_known_args()
+
+    if args.benchmark:
+        os.environ["QT_QPA_PLATFORM"] = "offscreen"
+        app = QApplication(sys.argv[:1] + qt_args)
+        results = run_benchmarks()
+        baseline = {}
+        if os.path.exists(args.benchmark) and not args.update_baseline:
+            with open(args.benchmark) as f:
+                baseline = json.load(f)
+        for name, value in results.items():
+            base = baseline.get(name)
+            print(f"{name:18} {value:10.2f}" + (f"   baseline {base:10.2f}" if base is not None else ""))
+        if not baseline:
+            with open(args.benchmark, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"Baseline written to {args.benchmark}")
+            sys.exit(0)
+        regressions = benchmark_regressions(results, baseline, args.threshold)
+        for name, base, value in regressions:
+            print(f"REGRESSION {name}: {value:.2f} vs baseline {base:.2f} (+{(value / base - 1) * 100:.0f}%)")
+        sys.exit(1 if regressions else 0)
+
+    if args.daemon:
+        host, _, port = args.daemon.rpartition(":")
+        daemon = AutomationDaemon(host or "127.0.0.1", int(port))
+        print(f"Automation API listening on http://{host or '127.0.0.1'}:{port} (Ctrl+C to stop)")
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            sys.exit(0)
+
+    if args.standin == "mqtt":
+        broker = MqttBrokerStandIn("0.0.0.0", 1883)
+        print("MQTT broker stand-in listening on port 1883, printing publish statistics every 10 s (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(10)
+                for topic, st in broker.stats().items():
+                    print(f"{topic}: {st['messages']} msgs, {st['packet_bytes']:.0f} B/packet, "
+                          f"{st['messages_per_s']:.3f} msg/s, {st['messages_per_s'] * st['packet_bytes']:.1f} B/s")
+        except KeyboardInterrupt:
+            sys.exit(0)
+
+    if args.replay and args.replay_to:
+        try:
+            with serial.Serial(args.replay_to, 115200, timeout=0.1) as ser:
+                replay_to_port(TrafficLog(args.replay), ser, args.replay_speed)
+        except (OSError, ValueError, serial.SerialException) as e:
+            print(f"Replay failed: {e}")
+            sys.exit(1)
+        sys.exit(0)
+
+    if args.standin == "update":
+        standin = UpdateServerStandIn(args.standin_dir, port=8080)
+        print(f"Release stand-in serving {standin.directory} on http://127.0.0.1:8080 "
+              "(run the GUI with IOT_CONFIGURATOR_UPDATE_API=http://127.0.0.1:8080; Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            sys.exit(0)
+
+    if args.standin == "bootloader":
+        if not PTY_AVAILABLE:
+            print("The bootloader stand-in needs pseudo-terminals (Linux/macOS)")
+            sys.exit(1)
+        standin = BootloaderStandIn(args.nak_every)
+        print(f"Bootloader stand-in listening on {standin.device} (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            sys.exit(0)
+
+    profiler = None
+    if args.profile:
+        profiler = Profiler(args.profile, args.cprofile)
+        profiler.instrument(USBConfigTool)
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    if profiler:
+        profiler.start()
+        app.aboutToQuit.connect(profiler.write)
     win = USBConfigTool()
+    if args.record:
+        win.recorder = TrafficRecorder(args.record)
+        app.aboutToQuit.connect(win.recorder.close)
     win.show()
+    if args.replay:
+        win.start_replay(args.replay, args.replay_speed)
     sys.exit(app.exec_())
\ No newline at end of file
@@ -0,0 +1,11 @@
+import importlib.util
+import os
+import sys
+
+# The application is a single script; load it as a module for the tests
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+spec = importlib.util.spec_from_file_location("iot_configurator", os.path.join(ROOT, "IOT Configurator - Github.py"))
+iot_configurator = importlib.util.module_from_spec(spec)
+sys.modules["iot_configurator"] = iot_configurator
+spec.loader.exec_module(iot_configurator)
@@ -0,0 +1,44 @@
+import json
+
+from iot_configurator import SerialSession, exchange
+
+class ScriptedPort:
+    """Answers each command line with the replies the device function returns"""
+    def __init__(self, device):
+        self.device = device
+        self.lines = []
+        self.is_open = True
+
+    def write(self, data):
+        for line in data.decode().splitlines():
+            self.lines.extend(json.dumps(r) + "\n" for r in self.device(json.loads(line)))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def readline(self):
+        return self.lines.pop(0).encode() if self.lines else b""
+
+    def reset_input_buffer(self):
+        pass
+
+def test_reply_of_the_wrong_kind_is_not_taken():
+    # Seq matches, but a register map cannot answer a checksum request
+    port = ScriptedPort(lambda cmd: [{"DataType": 3, "Seq": cmd["Seq"], "Name": []},
+                                     {"DataType": 6, "Seq": cmd["Seq"], "CRC": 7}])
+    assert exchange(port, [{"DataType": 5, "Section": 1}], timeout=0.2) == [{"DataType": 6, "Seq": 1, "CRC": 7}]
+
+def test_session_numbers_requests_across_exchanges():
+    late = []
+    def device(cmd):
+        # Every answer arrives one request late
+        replies = late[:]
+        late[:] = [{"DataType": 8, "Seq": cmd["Seq"], "Version": str(cmd["Seq"])}]
+        return replies
+    session = SerialSession("test")
+    session.ser = ScriptedPort(device)
+    assert session.request([{"DataType": 7}], timeout=0.2) == [None]
+    # The late answer to the first request must not be taken for the second one
+    assert session.request([{"DataType": 7}], timeout=0.2) == [None]
+    assert session.next_seq == 3
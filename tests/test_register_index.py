@@ -0,0 +1,23 @@
+import random
+
+from iot_configurator import FUNCTION_NAMES, RegisterIndex
+
+def brute_force(rows, slave=None, functions=None):
+    return {r for r, (name, s, address, function, _) in rows.items()
+            if (slave is None or (s == slave and (name or address is not None)))
+            and (functions is None or (function in functions and name))}
+
+def test_slave_and_function_indexes_follow_edits():
+    rng = random.Random(1)
+    index = RegisterIndex()
+    for _ in range(2000):
+        row = rng.randrange(32)
+        name = rng.choice(["", "volt", "amps", "temp"])
+        address = rng.choice([None, rng.randrange(50)])
+        index.update(row, name, rng.randrange(4), address, rng.randrange(1, 5), 2)
+    for slave in range(4):
+        assert index.query(f"slave:{slave}") == brute_force(index.rows, slave=slave)
+    for fc in range(1, 5):
+        assert index.query(f"fc:{fc}") == brute_force(index.rows, functions={fc})
+    assert index.query("fc:hold") == brute_force(index.rows, functions={FUNCTION_NAMES.index("Holding Registers") + 1})
+    assert index.query("slave:2 fc:3") == brute_force(index.rows, slave=2, functions={3})
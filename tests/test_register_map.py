@@ -0,0 +1,58 @@
+import pytest
+
+from iot_configurator import RegisterMap
+
+def registers(**overrides):
+    data = {"Name": ["Volt", "Amps"], "Address": [100, 101], "Function": [3, 4], "SlaveID": [1, 2], "Bytes": [2, 4]}
+    data.update(overrides)
+    return data
+
+def test_json_round_trip():
+    data = registers()
+    assert RegisterMap.from_json(data).to_json() == data
+
+def test_missing_bytes_defaults_to_one():
+    data = registers()
+    del data["Bytes"]
+    assert RegisterMap.from_json(data).widths.tolist() == [1, 1]
+
+@pytest.mark.parametrize("key", ["Name", "Address", "Function", "SlaveID"])
+def test_missing_column_rejected(key):
+    data = registers()
+    del data[key]
+    with pytest.raises(ValueError, match=key):
+        RegisterMap.from_json(data)
+
+@pytest.mark.parametrize("overrides", [
+    {"SlaveID": [1, 250]},
+    {"Function": [3, 9]},
+    {"Function": [0, 3]},
+    {"Bytes": [2, 5]},
+    {"Address": [100, 70000]},
+    {"Address": [100, -1]},
+    {"Bytes": [2]},
+    {"Address": [100, "x"]},
+])
+def test_out_of_range_rejected_like_append(overrides):
+    with pytest.raises(ValueError):
+        RegisterMap.from_json(registers(**overrides))
+
+def test_names_truncated_to_eleven_bytes():
+    regs = RegisterMap.from_json(registers(Name=["a" * 20, "é" * 6]))
+    assert regs.name_list() == ["a" * 11, "é" * 5]
+    assert regs.name(1) == "é" * 5
+
+def test_binary_round_trip():
+    regs = RegisterMap.from_json(registers())
+    decoded = RegisterMap.from_bytes(regs.to_bytes())
+    assert decoded.to_json() == regs.to_json()
+    assert [decoded.name(i) for i in range(len(decoded))] == ["Volt", "Amps"]
+
+def test_binary_truncated_or_invalid_rejected():
+    buf = RegisterMap.from_json(registers()).to_bytes()
+    with pytest.raises(ValueError):
+        RegisterMap.from_bytes(buf[:-2])
+    bad = bytearray(buf)
+    bad[RegisterMap.WIRE_HEADER.size] = 250  # first slave ID
+    with pytest.raises(ValueError):
+        RegisterMap.from_bytes(bytes(bad))
@@ -0,0 +1,29 @@
+import json
+
+from iot_configurator import StreamDecoder, damaged_register_rows, drop_damaged_registers
+
+def decode(data):
+    return [e for e in StreamDecoder().feed(data) if e[0] == "end"]
+
+def test_complete_reply_has_no_errors():
+    reply = {"DataType": 3, "Name": ["a", "b"], "Address": [1, 2]}
+    [(_, obj, errors)] = decode(json.dumps(reply).encode() + b"\n")
+    assert obj == reply and errors == 0
+
+def test_damaged_element_costs_one_value():
+    [(_, obj, errors)] = decode(b'{"Name": ["a", "b", "c"], "Address": [1, 2x, 3]}\n')
+    assert obj["Address"] == [1, None, 3] and errors == 1
+    assert damaged_register_rows(obj) == [1]
+
+def test_truncated_reply_counts_as_error():
+    [(_, obj, errors)] = decode(b'{"DataType": 1, "SSID": "x", "PA\n')
+    assert obj == {"DataType": 1, "SSID": "x"} and errors == 1
+
+def test_control_byte_in_key_keeps_the_key():
+    [(_, obj, errors)] = decode(b'{"Addr\x01ess": [1, 2], "Name": ["a\x02b"]}\n')
+    assert obj == {"Address": [1, 2], "Name": ["a\x02b"]} and errors == 0
+
+def test_short_column_marks_rows_damaged():
+    data = {"Name": ["a", "b", "c"], "Address": [1, 2, 3], "Function": [3, 3, 3], "SlaveID": [1, 1, 1], "Bytes": [2]}
+    assert damaged_register_rows(data) == [1, 2]
+    assert drop_damaged_registers(data)["Name"] == ["a"]
@@ -0,0 +1,25 @@
+from iot_configurator import TrafficLog, TrafficRecorder
+
+def record(path, chunks, close=True):
+    recorder = TrafficRecorder(str(path))
+    for chunk in chunks:
+        recorder.record(TrafficRecorder.INBOUND, chunk)
+    if close:
+        recorder.close()
+    else:
+        recorder.file.close()
+
+def test_index_is_used_for_a_closed_recording(tmp_path):
+    record(tmp_path / "a.rec", [b"one", b"two"])
+    log = TrafficLog(str(tmp_path / "a.rec"))
+    assert [bytes(log[i][2]) for i in range(len(log))] == [b"one", b"two"]
+
+def test_stale_index_is_not_trusted(tmp_path):
+    path = tmp_path / "a.rec"
+    record(path, [b"x" * n for n in range(1, 40)])
+    stale = (tmp_path / "a.rec.idx").read_bytes()
+    record(path, [b"new"] * 3, close=False)
+    assert not (tmp_path / "a.rec.idx").exists()
+    (tmp_path / "a.rec.idx").write_bytes(stale)
+    log = TrafficLog(str(path))
+    assert [bytes(log[i][2]) for i in range(len(log))] == [b"new"] * 3
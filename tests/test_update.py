@@ -0,0 +1,85 @@
+import hashlib
+import os
+import random
+import zipfile
+
+import pytest
+
+from iot_configurator import UpdateChecker, UpdateServerStandIn, bspatch
+
+APP = "IOT Configurator - Github.py"
+OLD = b"".join(b"line %d of the installed version\r\n" % i for i in range(2000))
+NEW = OLD.replace(b"line 1000 ", b"line one thousand ") + b"# added in 1.1.0\r\n"
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+@pytest.fixture
+def release(tmp_path, monkeypatch):
+    """A 1.0.0 -> 1.1.0 release served by the stand-in; returns (release dir, installed file)"""
+    bsdiff4 = pytest.importorskip("bsdiff4")
+    rel = tmp_path / "release"
+    rel.mkdir()
+    (rel / "VERSION").write_text("1.1.0")
+    with zipfile.ZipFile(rel / "app.zip", "w") as z:
+        z.writestr(APP, NEW)
+    (rel / "SHA256SUMS").write_text(f"{sha256(NEW)}  {APP}\n")
+    (rel / "1.0.0-to-1.1.0.bsdiff").write_bytes(bsdiff4.diff(OLD, NEW))
+    installed = tmp_path / "install" / APP
+    installed.parent.mkdir()
+    installed.write_bytes(OLD)
+
+    server = UpdateServerStandIn(str(rel))
+    monkeypatch.setattr(UpdateChecker, "API_URL", f"http://127.0.0.1:{server.address[1]}")
+    monkeypatch.setattr(UpdateChecker, "CURRENT_VERSION", "1.0.0")
+    yield rel, installed
+    server.close()
+
+def test_bspatch_matches_bsdiff4():
+    bsdiff4 = pytest.importorskip("bsdiff4")
+    rng = random.Random(7)
+    for _ in range(20):
+        old = bytes(rng.randrange(256) for _ in range(rng.randrange(4000)))
+        new = bytearray(old)
+        for _ in range(40):
+            if new:
+                new[rng.randrange(len(new))] = rng.randrange(256)
+        new = bytes(new) + bytes(rng.randrange(256) for _ in range(rng.randrange(200)))
+        assert bspatch(old, bsdiff4.diff(old, new)) == new
+
+def test_bspatch_rejects_other_formats():
+    with pytest.raises(ValueError):
+        bspatch(OLD, b"not a patch" * 4)
+
+def test_release_info_lists_assets(release):
+    latest = UpdateChecker.get_latest_release_info()
+    assert latest["version"] == "1.1.0"
+    assert set(latest["assets"]) == {"app.zip", "SHA256SUMS", "1.0.0-to-1.1.0.bsdiff"}
+    assert latest["download_url"].endswith("/app.zip")
+
+def test_delta_applied_and_verified(release, tmp_path):
+    latest = UpdateChecker.get_latest_release_info()
+    path = UpdateChecker.apply_delta(latest, str(release[1]), str(tmp_path))
+    with open(path, "rb") as f:
+        assert f.read() == NEW
+
+def test_modified_install_falls_back_to_full_zip(release, tmp_path):
+    release[1].write_bytes(b"#" + OLD[1:])
+    latest = UpdateChecker.get_latest_release_info()
+    assert UpdateChecker.apply_delta(latest, str(release[1]), str(tmp_path)) is None
+    with open(UpdateChecker.download_full(latest, str(tmp_path)), "rb") as f:
+        assert f.read() == NEW
+
+def test_missing_sha256sums_falls_back_to_full_zip(release, tmp_path):
+    os.remove(release[0] / "SHA256SUMS")
+    latest = UpdateChecker.get_latest_release_info()
+    assert UpdateChecker.apply_delta(latest, str(release[1]), str(tmp_path)) is None
+    with open(UpdateChecker.download_full(latest, str(tmp_path)), "rb") as f:
+        assert f.read() == NEW
+
+def test_zip_with_wrong_hash_rejected(release, tmp_path):
+    with zipfile.ZipFile(release[0] / "app.zip", "w") as z:
+        z.writestr(APP, NEW + b"# tampered\r\n")
+    latest = UpdateChecker.get_latest_release_info()
+    with pytest.raises(Exception, match="SHA-256"):
+        UpdateChecker.download_full(latest, str(tmp_path))
@@ -0,0 +1,46 @@
+import pytest
+
+from iot_configurator import CONFIG_SCHEMA, validate_config, validate_registers
+
+CONFIG = {
+    "SSID": "plant", "PASS": "secret", "SiteName": "North", "PanelName": "P1", "Interval": 60,
+    "BaudRate": 9600, "StopBit": 8192, "Parity": 1024, "IP": "10.0.0.2", "Port": "1883",
+    "mqttUser": "", "mqttPass": "", "PubTopic": "up", "SubTopic": "down",
+}
+
+def test_complete_config_passes_in_wire_types():
+    config = validate_config(dict(CONFIG, Port=1883, Interval="60"))
+    assert config == CONFIG
+    assert list(config) == [spec.key for spec in CONFIG_SCHEMA]
+
+@pytest.mark.parametrize("body", [[], "x", None])
+def test_non_object_rejected(body):
+    with pytest.raises(ValueError, match="JSON object"):
+        validate_config(body)
+    with pytest.raises(ValueError, match="JSON object"):
+        validate_registers(body)
+
+def test_missing_fields_rejected():
+    with pytest.raises(ValueError, match="missing fields"):
+        validate_config({"SSID": "x"})
+
+@pytest.mark.parametrize("overrides", [
+    {"Interval": "abc"}, {"Interval": 0}, {"Interval": 1.5}, {"Interval": True},
+    {"BaudRate": 12345}, {"StopBit": None}, {"Parity": "0"},
+    {"Port": "99999"}, {"Port": -1},
+    {"SSID": 5}, {"SiteName": "x" * 17},
+])
+def test_values_the_gui_would_not_accept_rejected(overrides):
+    with pytest.raises(ValueError):
+        validate_config(dict(CONFIG, **overrides))
+
+def test_registers_need_every_column():
+    data = {"Name": ["a"], "Address": [1], "Function": [3], "SlaveID": [1]}
+    with pytest.raises(ValueError, match="Bytes"):
+        validate_registers(data)
+    assert validate_registers(dict(data, Bytes=[2]))["Bytes"] == [2]
+
+def test_registers_limited_to_table_size():
+    n = 129
+    with pytest.raises(ValueError):
+        validate_registers({"Name": ["a"] * n, "Address": [1] * n, "Function": [3] * n, "SlaveID": [1] * n, "Bytes": [1] * n})